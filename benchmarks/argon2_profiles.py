@@ -0,0 +1,107 @@
+'''
+Argon2 cost profile benchmark.
+
+Measures how long a password hash takes on the current machine for a few
+Argon2 profiles (time cost, memory cost in KiB, parallelism), one at a time
+and with `--threads` hashes running together the way the login thread pool
+runs them, to help pick ARGON2_TIME_COST / ARGON2_MEMORY_COST /
+ARGON2_PARALLELISM for a given pod size.
+
+The profile currently configured through the ARGON2_* variables is always
+included. Extra profiles can be given as time:memory:parallelism.
+
+run: python benchmarks/argon2_profiles.py --iterations 20 --profile 2:19456:1
+'''
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+PROFILES = {
+    "owasp-minimum": (2, 19456, 1),
+    "rfc9106-low-memory": (3, 65536, 4),
+    "high-memory": (1, 262144, 4),
+}
+
+
+def parse_profile(value):
+    try:
+        time_cost, memory_cost, parallelism = (int(part) for part in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("profile must be time:memory:parallelism, e.g. 2:19456:1")
+    return value, (time_cost, memory_cost, parallelism)
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def bench_profile(time_cost, memory_cost, parallelism, iterations, threads):
+    context = CryptContext(
+        schemes=["argon2"],
+        argon2__time_cost=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism,
+    )
+    hashed = context.hash("benchmark-password")
+
+    hash_times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        context.hash("benchmark-password")
+        hash_times.append(time.perf_counter() - start)
+
+    verify_times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        context.verify("benchmark-password", hashed)
+        verify_times.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        start = time.perf_counter()
+        list(executor.map(lambda _: context.verify("benchmark-password", hashed), range(iterations * threads)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "hash_p50": statistics.median(hash_times) * 1000,
+        "hash_p95": percentile(hash_times, 0.95) * 1000,
+        "verify_p50": statistics.median(verify_times) * 1000,
+        "verify_p95": percentile(verify_times, 0.95) * 1000,
+        "logins_per_second": iterations * threads / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10, help="hashes per profile and per thread (10)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("ARGON2_WORKERS", os.cpu_count() or 1)),
+                        help="concurrent verifies for the throughput column (ARGON2_WORKERS or CPU count)")
+    parser.add_argument("--profile", type=parse_profile, action="append", default=[],
+                        help="extra profile as time:memory_kib:parallelism, can be repeated")
+    args = parser.parse_args()
+
+    profiles = dict(PROFILES)
+    profiles["current"] = (
+        int(os.getenv("ARGON2_TIME_COST", 3)),
+        int(os.getenv("ARGON2_MEMORY_COST", 65536)),
+        int(os.getenv("ARGON2_PARALLELISM", 4)),
+    )
+    profiles.update(args.profile)
+
+    print(f"{'profile':<20} {'t':>3} {'m (KiB)':>9} {'p':>3} {'hash p50':>9} {'hash p95':>9} "
+          f"{'verify p50':>11} {'verify p95':>11} {'logins/s':>9}")
+    for name, (time_cost, memory_cost, parallelism) in profiles.items():
+        result = bench_profile(time_cost, memory_cost, parallelism, args.iterations, args.threads)
+        print(f"{name:<20} {time_cost:>3} {memory_cost:>9} {parallelism:>3} "
+              f"{result['hash_p50']:>7.1f}ms {result['hash_p95']:>7.1f}ms "
+              f"{result['verify_p50']:>9.1f}ms {result['verify_p95']:>9.1f}ms "
+              f"{result['logins_per_second']:>9.1f}")
+    print(f"logins/s: verifies per second with {args.threads} thread(s), the ceiling for /auth/login on this machine")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+'''
+Concurrent-request throughput benchmark.
+
+Boots `main:app` with uvicorn against a throwaway SQLite database, creates a
+user with a few orders and fires authenticated requests at a fixed
+concurrency, reporting requests per second for each route.
+
+Only talks HTTP to the server, so the same script can be run before and after
+a change to compare numbers.
+
+run: python benchmarks/concurrency.py --requests 2000 --concurrency 50
+'''
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def start_server(port, database_url, extra_env=None):
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        SECRET_KEY=os.getenv("SECRET_KEY", "benchmark-secret-key"),
+        ALGORITHM=os.getenv("ALGORITHM", "HS256"),
+        ACCESS_TOKEN_EXPIRE_MINUTES=os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"),
+        **(extra_env or {}),
+    )
+    subprocess.run(["alembic", "upgrade", "head"], cwd=ROOT, env=env, check=True, capture_output=True)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{base_url}/auth/", timeout=1)
+            return server, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+def seed(base_url, orders):
+    user = {"name": "bench", "email": "bench@bench.com", "password": "bench", "activated": True, "admin": True}
+    requests.post(f"{base_url}/auth/signup_admin", json=user).raise_for_status()
+    response = requests.post(f"{base_url}/auth/login", json={"email": user["email"], "password": user["password"]})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    for _ in range(orders):
+        requests.post(f"{base_url}/orders/order", json={"user_id": 1}, headers=headers).raise_for_status()
+    return headers
+
+
+def run(base_url, path, headers, total, concurrency):
+    def call(_):
+        with requests.get(f"{base_url}{path}", headers=headers) as response:
+            return response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        status_codes = list(executor.map(call, range(total)))
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for code in status_codes if code >= 400)
+    return total / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--orders", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server, base_url = start_server(args.port, f"sqlite:///{tmp}/benchmark.db")
+        try:
+            headers = seed(base_url, args.orders)
+            for path in ["/orders/", "/orders/list", "/orders/list/orders_user/1", "/orders/order/1"]:
+                throughput, errors = run(base_url, path, headers, args.requests, args.concurrency)
+                print(f"{path:<32} {throughput:>10.1f} req/s  errors={errors}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
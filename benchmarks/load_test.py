@@ -0,0 +1,211 @@
+'''
+Mixed-workload load test.
+
+Boots `main:app` with uvicorn (against a throwaway SQLite database, or the
+database given with --database-url, e.g. a local Postgres), seeds --users
+users with --orders orders of --items items each, then drives a weighted mix
+of login, create order, add item, list orders and get order requests at a
+fixed concurrency.
+
+For each endpoint it reports throughput, p50/p95/p99 latency and the average
+number of SQL statements per request, read from the server's own
+http_request_db_queries_total counter on /metrics, so N+1 regressions in
+order_routers.py show up as a jump in the queries column.
+
+The run is reproducible for a given --seed: the same users, payloads and
+request sequence are generated every time.
+
+run: python benchmarks/load_test.py --requests 5000 --concurrency 50 --mix login=1,get_order=10
+'''
+import argparse
+import random
+import re
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from jose import jwt
+
+from concurrency import start_server
+
+# endpoint name -> (method, route template as labelled in /metrics, default weight)
+ENDPOINTS = {
+    "login": ("POST", "/auth/login", 1),
+    "create_order": ("POST", "/orders/order", 2),
+    "add_item": ("POST", "/orders/order/add_item/{order_id}", 3),
+    "list_orders": ("GET", "/orders/list/orders_user/{user_id}", 4),
+    "get_order": ("GET", "/orders/order/{order_id}", 10),
+}
+PASSWORD = "benchmark-password"
+FLAVORS = ["calabresa", "mussarela", "portuguesa", "frango"]
+METRIC_LINE = re.compile(r'^http_request_db_queries_total\{method="([^"]+)",route="([^"]+)"\} ([0-9.e+]+)$')
+
+# login attempts in the mix must not be answered by the rate limiter
+SERVER_ENV = {
+    "LOGIN_IP_BURST": "1000000000",
+    "LOGIN_IP_PER_MINUTE": "1000000000",
+    "LOGIN_EMAIL_BURST": "1000000000",
+    "LOGIN_EMAIL_PER_MINUTE": "1000000000",
+}
+
+
+def parse_mix(value):
+    mix = {}
+    try:
+        for part in value.split(","):
+            name, weight = part.split("=")
+            mix[name.strip()] = float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError("mix must be name=weight pairs, e.g. login=1,get_order=10")
+    unknown = set(mix) - set(ENDPOINTS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown endpoints {sorted(unknown)}, choose from {sorted(ENDPOINTS)}")
+    return mix
+
+
+def random_item(rng):
+    return {
+        "quantity": rng.randint(1, 3),
+        "flavor": rng.choice(FLAVORS),
+        "size": rng.choice([25, 35, 45]),
+        "unit_price": rng.choice([29.9, 39.9, 49.9]),
+    }
+
+
+def scrape_db_queries(base_url, metrics_token):
+    headers = {"Authorization": f"Bearer {metrics_token}"} if metrics_token else {}
+    response = requests.get(f"{base_url}/metrics", headers=headers)
+    response.raise_for_status()
+    queries = {}
+    for line in response.text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            queries[(match.group(1), match.group(2))] = float(match.group(3))
+    return queries
+
+
+def seed(base_url, users, orders, items, rng):
+    # unique emails so reruns against a persistent database don't collide
+    run_id = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+    accounts = []
+    with requests.Session() as http:
+        for index in range(users):
+            email = f"bench-{run_id}-{index}@bench.com"
+            user = {"name": f"bench {index}", "email": email, "password": PASSWORD, "activated": True, "admin": False}
+            http.post(f"{base_url}/auth/signup_admin", json=user).raise_for_status()
+            response = http.post(f"{base_url}/auth/login", json={"email": email, "password": PASSWORD})
+            response.raise_for_status()
+            access_token = response.json()["access_token"]
+            # user ids are assigned by the database, the token subject carries it
+            user_id = int(jwt.get_unverified_claims(access_token)["sub"])
+            headers = {"Authorization": f"Bearer {access_token}"}
+            accounts.append({"email": email, "headers": headers, "user_id": user_id, "order_ids": []})
+        for account in accounts:
+            for _ in range(orders):
+                payload = {"user_id": account["user_id"], "itens": [random_item(rng) for _ in range(items)]}
+                response = http.post(f"{base_url}/orders/order/with_items", json=payload, headers=account["headers"])
+                response.raise_for_status()
+                account["order_ids"].append(response.json()["order"]["id"])
+    return accounts
+
+
+def build_request(name, account, rng):
+    if name == "login":
+        return "POST", "/auth/login", {"email": account["email"], "password": PASSWORD}
+    if name == "create_order":
+        return "POST", "/orders/order", {"user_id": account["user_id"]}
+    order_id = rng.choice(account["order_ids"]) if account["order_ids"] else 0
+    if name == "add_item":
+        return "POST", f"/orders/order/add_item/{order_id}", random_item(rng)
+    if name == "list_orders":
+        return "GET", f"/orders/list/orders_user/{account['user_id']}", None
+    return "GET", f"/orders/order/{order_id}", None
+
+
+def run(base_url, accounts, mix, total, concurrency, seed_value):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    # the whole request sequence is drawn up front so it doesn't depend on thread scheduling
+    rng = random.Random(seed_value)
+    plan = []
+    for _ in range(total):
+        name = rng.choices(names, weights)[0]
+        account = rng.choice(accounts)
+        plan.append((name, account, *build_request(name, account, rng)))
+
+    local = threading.local()
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+
+    def call(entry):
+        name, account, method, path, payload = entry
+        http = getattr(local, "http", None)
+        if http is None:
+            http = local.http = requests.Session()
+        headers = None if name == "login" else account["headers"]
+        start = time.perf_counter()
+        response = http.request(method, f"{base_url}{path}", json=payload, headers=headers)
+        elapsed = time.perf_counter() - start
+        latencies[name].append(elapsed)
+        if response.status_code >= 400:
+            errors[name] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, plan))
+    return latencies, errors, time.perf_counter() - start
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests in the mixed run (2000)")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight (20)")
+    parser.add_argument("--users", type=int, default=10, help="seeded users (10)")
+    parser.add_argument("--orders", type=int, default=10, help="seeded orders per user (10)")
+    parser.add_argument("--items", type=int, default=3, help="seeded items per order (3)")
+    parser.add_argument("--mix", type=parse_mix, default={name: weight for name, (_, _, weight) in ENDPOINTS.items()},
+                        help="endpoint weights as name=weight pairs (" +
+                             ",".join(f"{name}={weight}" for name, (_, _, weight) in ENDPOINTS.items()) + ")")
+    parser.add_argument("--database-url", help="database to run against, e.g. a local Postgres (throwaway SQLite)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for data and request order (0)")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{tmp}/benchmark.db"
+        metrics_token = uuid.uuid4().hex
+        server, base_url = start_server(args.port, database_url, dict(SERVER_ENV, METRICS_TOKEN=metrics_token))
+        try:
+            accounts = seed(base_url, args.users, args.orders, args.items, rng)
+            queries_before = scrape_db_queries(base_url, metrics_token)
+            latencies, errors, elapsed = run(base_url, accounts, args.mix, args.requests, args.concurrency, args.seed)
+            queries_after = scrape_db_queries(base_url, metrics_token)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{args.requests} requests in {elapsed:.1f}s at concurrency {args.concurrency}: "
+          f"{args.requests / elapsed:.1f} req/s ({args.users} users, {args.orders} orders/user, {args.items} items/order)")
+    print(f"{'endpoint':<14} {'requests':>8} {'errors':>7} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'queries/req':>12}")
+    for name, samples in latencies.items():
+        if not samples:
+            continue
+        method, route, _ = ENDPOINTS[name]
+        queries = queries_after.get((method, route), 0) - queries_before.get((method, route), 0)
+        print(f"{name:<14} {len(samples):>8} {errors[name]:>7} {len(samples) / elapsed:>8.1f} "
+              f"{statistics.median(samples) * 1000:>7.1f}ms {percentile(samples, 0.95) * 1000:>7.1f}ms "
+              f"{percentile(samples, 0.99) * 1000:>7.1f}ms {queries / len(samples):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,144 @@
-from fastapi import Depends, HTTPException
-from main import SECRET_KEY, ALGORITHM, oath2_schema
-from models import db
-from sqlalchemy.orm import Session, sessionmaker
+from fastapi import Depends, HTTPException, Request
+from main import STATELESS_AUTH, oath2_schema
+from models import SessionLocal
+from sqlalchemy import event, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import User
-from jose import jwt, JWTError
+from jose import JWTError
+from jwt_keys import key_ring
+from cache import TTLCache
+import asyncio
+import hashlib
+import logging
+import os
+import time
 
-def get_session():
-    try:
-        Session = sessionmaker(bind=db)
-        session = Session()
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 300))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+# seconds between reloads of the revoked token versions from the users table,
+# the delay before a revocation made by another worker applies here
+REVOKED_TOKENS_REFRESH_INTERVAL = float(os.getenv("REVOKED_TOKENS_REFRESH_INTERVAL", 30))
+
+logger = logging.getLogger(__name__)
+
+# authenticated users by id, kept detached from any session
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+# validated token payloads by sha256 of the token; entries never outlive "exp"
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+# lowest token version still accepted per user id; tokens with an older
+# "ver" claim are rejected by verify_token_claims. Loaded from the users table
+# at startup and every REVOKED_TOKENS_REFRESH_INTERVAL, and updated at once by
+# the mapper events below for changes made by this worker
+revoked_token_versions = {}
+
+async def load_revoked_token_versions():
+    async with SessionLocal() as session:
+        result = await session.execute(select(User.id, User.token_version).where(User.token_version > 0))
+        for user_id, token_version in result:
+            # deleted users are only known to this worker and stay one version ahead
+            if token_version > revoked_token_versions.get(user_id, 0):
+                revoked_token_versions[user_id] = token_version
+
+async def refresh_revoked_token_versions(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await load_revoked_token_versions()
+        except SQLAlchemyError:
+            # keep the last known versions and try again on the next tick
+            logger.exception("could not reload revoked token versions")
+
+@event.listens_for(User, "after_update")
+def invalidate_cached_user(mapper, connection, target):
+    # covers deactivation and admin promotion made by this process;
+    # other workers pick the change up once USER_CACHE_TTL expires
+    user_cache.invalidate(target.id)
+    revoked_token_versions[target.id] = target.token_version
+
+@event.listens_for(User, "after_delete")
+def invalidate_deleted_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+    revoked_token_versions[target.id] = (target.token_version or 0) + 1
+
+class TokenUser:
+    """User principal rebuilt from the access token claims, without a DB lookup."""
+
+    def __init__(self, id, admin, activated):
+        self.id = id
+        self.admin = admin
+        self.activated = activated
+
+async def get_session():
+    # the connection is checked out on the first statement, not here, so
+    # routes served from the caches or waiting on Argon2 don't hold one;
+    # a pool timeout is turned into a 503 by the handler in main.py
+    async with SessionLocal() as session:
         yield session
-    finally:
-        session.close()
-        
-def verify_token(token: str = Depends(oath2_schema), session: Session = Depends(get_session)):
+
+def decode_token(token):
+    token_hash = hashlib.sha256(token.encode()).digest()
+    dict_info = token_cache.get(token_hash)
+    if dict_info is not None:
+        return dict_info
     try:
-        dict_info = jwt.decode(token, SECRET_KEY, ALGORITHM)
-        user_id = int(dict_info.get("sub"))
-    except JWTError:
+        dict_info = key_ring.decode(token)
+        int(dict_info.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="Access denied, check token validity")
+    if "exp" in dict_info:
+        token_cache.set(token_hash, dict_info, min(TOKEN_CACHE_TTL, dict_info["exp"] - time.time()))
+    return dict_info
+
+def decode_access_token(token):
+    dict_info = decode_token(token)
+    # refresh tokens are only accepted by /auth/refresh; tokens issued
+    # before the "typ" claim existed are access tokens
+    if dict_info.get("typ", "access") != "access":
         raise HTTPException(status_code=401, detail="Access denied, check token validity")
-    user = session.query(User).filter(User.id==user_id).first()
-    if not user:
+    return dict_info
+        
+async def verify_token(request: Request, token: str = Depends(oath2_schema), session: AsyncSession = Depends(get_session)):
+    # router and endpoint dependencies share the result through request.state,
+    # so the token is decoded and the user loaded once per request
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user
+    dict_info = decode_access_token(token)
+    user_id = int(dict_info.get("sub"))
+    user = user_cache.get(user_id)
+    if user is None:
+        result = await session.execute(select(User).where(User.id == user_id))
+        user = result.scalars().first()
+        if not user:
+            raise HTTPException(status_code=401, detail="Invalid access")
+        session.expunge(user)
+        user_cache.set(user_id, user)
+    request.state.token_payload = dict_info
+    request.state.user = user
+    return user
+
+async def verify_token_claims(request: Request, token: str = Depends(oath2_schema)):
+    # stateless variant of verify_token: authorization comes from the signed
+    # admin/activated claims and the token version is checked against the
+    # in-memory revocation list, so the users table is never queried
+    user = getattr(request.state, "user", None) or getattr(request.state, "token_user", None)
+    if user is not None:
+        return user
+    dict_info = decode_access_token(token)
+    user_id = int(dict_info.get("sub"))
+    if "ver" not in dict_info or "admin" not in dict_info or "activated" not in dict_info:
+        raise HTTPException(status_code=401, detail="Access denied, check token validity")
+    if dict_info["ver"] < revoked_token_versions.get(user_id, 0) or not dict_info["activated"]:
         raise HTTPException(status_code=401, detail="Invalid access")
-    return user
\ No newline at end of file
+    user = TokenUser(user_id, dict_info["admin"], dict_info["activated"])
+    request.state.token_payload = dict_info
+    request.state.token_user = user
+    return user
+
+# dependency for read-only routes: opt in to claims-only verification with STATELESS_AUTH=true
+verify_token_read = verify_token_claims if STATELESS_AUTH else verify_token
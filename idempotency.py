@@ -0,0 +1,174 @@
+import hashlib
+import os
+import time
+
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from fastapi.security.utils import get_authorization_scheme_param
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+from cache import TTLCache
+from dependencies import decode_access_token
+from models import IdempotencyKey, SessionLocal
+
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "memory")
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 86400))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+# a key still "in progress" after this long belongs to a worker that died
+IDEMPOTENCY_PENDING_TIMEOUT = float(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", 60))
+# minimum seconds between deletions of expired rows by the database store
+IDEMPOTENCY_PRUNE_INTERVAL = float(os.getenv("IDEMPOTENCY_PRUNE_INTERVAL", 300))
+
+
+class MemoryIdempotencyStore:
+    """Per-process store, enough when the API runs a single worker."""
+
+    def __init__(self, maxsize, ttl):
+        self.cache = TTLCache(maxsize, ttl)
+
+    async def claim(self, key, request_hash):
+        record = self.cache.get(key)
+        if record is None:
+            self.cache.set(key, {"request_hash": request_hash, "status_code": None})
+        return record
+
+    async def save(self, key, record):
+        self.cache.set(key, record)
+
+    async def release(self, key):
+        self.cache.invalidate(key)
+
+
+class DatabaseIdempotencyStore:
+    """Store backed by the idempotency_keys table, shared by every worker.
+
+    Expired rows are deleted by the claims themselves, at most once every
+    `prune_interval` seconds per worker, so the table holds roughly one TTL
+    worth of responses.
+    """
+
+    def __init__(self, ttl, pending_timeout, prune_interval):
+        self.ttl = ttl
+        self.pending_timeout = pending_timeout
+        self.prune_interval = prune_interval
+        self.pruned_at = 0.0
+
+    async def claim(self, key, request_hash):
+        async with SessionLocal() as session:
+            now = time.time()
+            if time.monotonic() - self.pruned_at >= self.prune_interval:
+                self.pruned_at = time.monotonic()
+                await session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < now - self.ttl))
+            row = await session.get(IdempotencyKey, key)
+            if row is not None:
+                expired = now - row.created_at > self.ttl
+                abandoned = row.status_code is None and now - row.created_at > self.pending_timeout
+                if not expired and not abandoned:
+                    return {
+                        "request_hash": row.request_hash,
+                        "status_code": row.status_code,
+                        "body": row.response_body,
+                        "media_type": row.media_type,
+                    }
+                await session.delete(row)
+                await session.flush()
+            session.add(IdempotencyKey(key, request_hash, now))
+            try:
+                await session.commit()
+            except IntegrityError:
+                # another worker claimed the same key first
+                return {"request_hash": request_hash, "status_code": None}
+        return None
+
+    async def save(self, key, record):
+        async with SessionLocal() as session:
+            row = await session.get(IdempotencyKey, key)
+            if row is not None:
+                row.status_code = record["status_code"]
+                row.response_body = record["body"]
+                row.media_type = record["media_type"]
+                await session.commit()
+
+    async def release(self, key):
+        async with SessionLocal() as session:
+            row = await session.get(IdempotencyKey, key)
+            if row is not None:
+                await session.delete(row)
+                await session.commit()
+
+
+def get_idempotency_store():
+    if IDEMPOTENCY_STORE == "database":
+        return DatabaseIdempotencyStore(IDEMPOTENCY_TTL, IDEMPOTENCY_PENDING_TIMEOUT, IDEMPOTENCY_PRUNE_INTERVAL)
+    return MemoryIdempotencyStore(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL)
+
+
+idempotency_store = get_idempotency_store()
+
+
+class IdempotentRoute(APIRoute):
+    """Route class honoring the `Idempotency-Key` header on POST routes.
+
+    The first request with a given key runs the handler and, if it succeeds,
+    its response is stored; retries with the same key (same caller, route and
+    body) get the stored response back without running the handler again.
+    Keys are scoped by the verified user id (the token's `sub`), so a key can
+    never replay another user's response and a retry sent with a refreshed
+    access token still finds the original one.
+    """
+
+    def get_route_handler(self):
+        route_handler = super().get_route_handler()
+        if "POST" not in self.methods:
+            return route_handler
+
+        async def idempotent_route_handler(request: Request) -> Response:
+            idempotency_key = request.headers.get("Idempotency-Key")
+            if not idempotency_key:
+                return await route_handler(request)
+            scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+            if scheme.lower() != "bearer" or not token:
+                raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+            # validated here, before the route's own dependencies run; the
+            # decoded payload is cached, so verify_token doesn't redo the work
+            user_id = decode_access_token(token)["sub"]
+            scope = "\n".join([
+                user_id,
+                request.method,
+                request.url.path,
+                idempotency_key,
+            ])
+            key = hashlib.sha256(scope.encode()).hexdigest()
+            request_hash = hashlib.sha256(await request.body()).hexdigest()
+
+            record = await idempotency_store.claim(key, request_hash)
+            if record is not None:
+                if record["request_hash"] != request_hash:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key already used with a different request body.")
+                if record["status_code"] is None:
+                    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed.")
+                return Response(
+                    content=record["body"],
+                    status_code=record["status_code"],
+                    media_type=record["media_type"],
+                    headers={"Idempotent-Replayed": "true"},
+                )
+
+            try:
+                response = await route_handler(request)
+            except BaseException:
+                await idempotency_store.release(key)
+                raise
+            if 200 <= response.status_code < 300:
+                await idempotency_store.save(key, {
+                    "request_hash": request_hash,
+                    "status_code": response.status_code,
+                    "body": response.body,
+                    "media_type": response.media_type,
+                })
+            else:
+                await idempotency_store.release(key)
+            return response
+
+        return idempotent_route_handler
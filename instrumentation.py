@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import random
+import sys
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from metrics import (
+    http_request_db_duration, http_request_db_queries, http_request_duration, http_requests_in_flight,
+    http_request_query_budget_exceeded,
+)
+from models import db
+
+# fraction of statements logged with timing, row count and route (0 disables)
+QUERY_LOG_SAMPLE_RATE = float(os.getenv("QUERY_LOG_SAMPLE_RATE", 0))
+# statements slower than this are always logged as warnings
+QUERY_LOG_SLOW_MS = float(os.getenv("QUERY_LOG_SLOW_MS", 500))
+QUERY_LOG_MAX_STATEMENT = 500
+# development/test guard: statements allowed per request (0 disables)
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", 0))
+# identical statements (only the parameters differ) per request before the
+# request is flagged as an N+1 pattern (0 disables)
+QUERY_REPEAT_LIMIT = int(os.getenv("QUERY_REPEAT_LIMIT", 0))
+# "warn" logs offending requests, "raise" fails them with QueryBudgetExceeded
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "warn").lower()
+
+sql_logger = logging.getLogger("sql")
+if not sql_logger.handlers:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    sql_logger.addHandler(handler)
+    sql_logger.setLevel(logging.INFO)
+    sql_logger.propagate = False
+
+
+class RequestContext:
+    """Per-request state shared with engine events through `current_request`."""
+
+    __slots__ = ("scope", "queries", "db_time", "statements")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_time = 0.0
+        # executions per statement text, only kept when QUERY_REPEAT_LIMIT is set
+        self.statements = {}
+
+    @property
+    def route_path(self):
+        # the router fills scope["route"] in place once the path is matched;
+        # unmatched paths share one label so 404 scans can't grow the metrics
+        route = self.scope.get("route")
+        return route.path if route else "unmatched"
+
+    @property
+    def route(self):
+        return f'{self.scope["method"]} {self.route_path}'
+
+
+current_request = ContextVar("current_request", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised after a request when QUERY_BUDGET_MODE=raise and it broke the budget."""
+
+
+def check_query_budget(request):
+    """Report a request over QUERY_BUDGET or repeating a statement QUERY_REPEAT_LIMIT times.
+
+    Statements are compared on their SQL text, which SQLAlchemy keeps apart
+    from the bound parameters, so the lazy load of `order.itens` issued once
+    per order shows up as one statement repeated N times.
+    """
+    reasons = []
+    if QUERY_BUDGET and request.queries > QUERY_BUDGET:
+        reasons.append("budget")
+    repeated = {
+        " ".join(statement.split())[:QUERY_LOG_MAX_STATEMENT]: count
+        for statement, count in request.statements.items()
+        if count >= QUERY_REPEAT_LIMIT
+    } if QUERY_REPEAT_LIMIT else {}
+    if repeated:
+        reasons.append("repeated")
+    if not reasons:
+        return
+    for reason in reasons:
+        http_request_query_budget_exceeded.inc(request.scope["method"], request.route_path, reason)
+    record = {
+        "route": request.route,
+        "queries": request.queries,
+        "budget": QUERY_BUDGET or None,
+        "repeated": repeated,
+    }
+    if QUERY_BUDGET_MODE == "raise":
+        raise QueryBudgetExceeded(json.dumps(record))
+    sql_logger.warning("query budget exceeded %s", json.dumps(record))
+
+
+class RequestContextMiddleware:
+    """Pure ASGI middleware making the running request visible to SQL events.
+
+    Also records the request metrics: latency by route and status, requests
+    in flight, and the SQL time and statement count accumulated by the
+    engine events below while the request was served.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request = RequestContext(scope)
+        token = current_request.set(request)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            current_request.reset(token)
+            method, route = scope["method"], request.route_path
+            http_request_duration.observe(elapsed, method, route, status[0])
+            http_request_db_duration.observe(request.db_time, method, route)
+            http_request_db_queries.inc(method, route, amount=request.queries)
+        # outside the finally so a failing request keeps its own exception;
+        # in raise mode the response is already sent, the error reaches the
+        # server log or, under TestClient, the test calling the route
+        check_query_budget(request)
+
+
+@event.listens_for(db.sync_engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(db.sync_engine, "handle_error")
+def drop_query_timer(exception_context):
+    # the failed statement never reaches after_cursor_execute
+    if exception_context.connection is not None and exception_context.connection.info.get("query_start"):
+        exception_context.connection.info["query_start"].pop()
+
+
+@event.listens_for(db.sync_engine, "after_cursor_execute")
+def log_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    request = current_request.get()
+    if request is not None:
+        request.queries += 1
+        request.db_time += elapsed
+        if QUERY_REPEAT_LIMIT:
+            request.statements[statement] = request.statements.get(statement, 0) + 1
+    elapsed_ms = elapsed * 1000
+    slow = elapsed_ms >= QUERY_LOG_SLOW_MS
+    if not slow and not (QUERY_LOG_SAMPLE_RATE and random.random() < QUERY_LOG_SAMPLE_RATE):
+        return
+    # parameters are left out on purpose, they carry password hashes and tokens
+    record = {
+        "route": request.route if request else None,
+        "duration_ms": round(elapsed_ms, 3),
+        "rows": cursor.rowcount if cursor.rowcount >= 0 else None,
+        "statement": " ".join(statement.split())[:QUERY_LOG_MAX_STATEMENT],
+    }
+    if slow:
+        sql_logger.warning("slow query %s", json.dumps(record))
+    else:
+        sql_logger.info("query %s", json.dumps(record))
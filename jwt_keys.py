@@ -0,0 +1,86 @@
+import os
+
+from cryptography.hazmat.primitives import serialization
+from jose import jwk, jwt, JWTError
+from main import SECRET_KEY, ALGORITHM
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "RS384", "RS512", "ES256", "ES384", "ES512")
+# directory of PEM keys named <kid>.pem; private keys can sign, every key verifies
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR")
+# kid used to sign new tokens, defaults to the last private key by name
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")
+
+
+class KeyRing:
+    """Signing and verification keys, parsed once instead of on every token.
+
+    With an HS* algorithm the ring holds only SECRET_KEY. With RS*/ES* it holds
+    every key found in `keys_dir`, so tokens signed by a key being rotated out
+    stay valid while new tokens are signed with the active kid, and the public
+    halves are published as a JWKS for other services to verify tokens locally.
+    """
+
+    def __init__(self, algorithm, secret_key, keys_dir=None, active_kid=None):
+        self.algorithm = algorithm
+        self.secret_key = secret_key
+        self.keys_dir = keys_dir
+        self.active_kid = active_kid
+        self.load()
+
+    @property
+    def asymmetric(self):
+        return self.algorithm in ASYMMETRIC_ALGORITHMS
+
+    def load(self):
+        if not self.asymmetric:
+            self.signing_kid = None
+            self.signing_key = jwk.construct(self.secret_key, self.algorithm)
+            self.verification_keys = {None: self.signing_key}
+            self.public_jwks = []
+            return
+        if not self.keys_dir:
+            raise RuntimeError(f"JWT_KEYS_DIR is required for {self.algorithm}")
+        private_keys = {}
+        verification_keys = {}
+        public_jwks = []
+        for filename in sorted(os.listdir(self.keys_dir)):
+            if not filename.endswith(".pem"):
+                continue
+            kid = filename[:-len(".pem")]
+            with open(os.path.join(self.keys_dir, filename), "rb") as key_file:
+                pem = key_file.read()
+            if b"PRIVATE KEY" in pem:
+                private_key = serialization.load_pem_private_key(pem, password=None)
+                private_keys[kid] = jwk.construct(pem, self.algorithm)
+                pem = private_key.public_key().public_bytes(
+                    serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+                )
+            public_key = jwk.construct(pem, self.algorithm)
+            verification_keys[kid] = public_key
+            public_jwks.append(dict(public_key.to_dict(), kid=kid, use="sig"))
+        if not private_keys:
+            raise RuntimeError(f"no private key found in {self.keys_dir}")
+        signing_kid = self.active_kid or list(private_keys)[-1]
+        if signing_kid not in private_keys:
+            raise RuntimeError(f"no private key for kid {signing_kid} in {self.keys_dir}")
+        self.signing_kid = signing_kid
+        self.signing_key = private_keys[signing_kid]
+        self.verification_keys = verification_keys
+        self.public_jwks = public_jwks
+
+    def encode(self, claims):
+        headers = {"kid": self.signing_kid} if self.signing_kid else None
+        return jwt.encode(claims, self.signing_key, self.algorithm, headers=headers)
+
+    def decode(self, token):
+        kid = jwt.get_unverified_header(token).get("kid") if self.asymmetric else None
+        key = self.verification_keys.get(kid)
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+    def jwks(self):
+        return {"keys": self.public_jwks}
+
+
+key_ring = KeyRing(ALGORITHM, SECRET_KEY, JWT_KEYS_DIR, JWT_ACTIVE_KID)
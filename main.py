@@ -1,7 +1,11 @@
 # Run API uvicorn main:app --reload
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -9,14 +13,55 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
+STATELESS_AUTH = os.getenv("STATELESS_AUTH", "false").lower() == "true"
+# Argon2 cost, defaults match passlib's; hashes made with other values are
+# rehashed on the next successful login
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # claims-only verification checks token versions in memory; load the
+    # revocations stored in the users table and keep following them, so a
+    # restart or a revocation made by another worker isn't missed
+    refresh_task = None
+    if STATELESS_AUTH:
+        await load_revoked_token_versions()
+        refresh_task = asyncio.create_task(refresh_revoked_token_versions(REVOKED_TOKENS_REFRESH_INTERVAL))
+    yield
+    if refresh_task is not None:
+        refresh_task.cancel()
 
-argon2_context = CryptContext(schemes=['argon2'], deprecated="auto")
+app = FastAPI(lifespan=lifespan)
+
+argon2_context = CryptContext(
+    schemes=['argon2'],
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
 oath2_schema = OAuth2PasswordBearer(tokenUrl="/auth/login_form")
 
-from routers.auth_routers import auth_router
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # no pooled connection freed up within DB_POOL_TIMEOUT
+    return JSONResponse(status_code=503, content={"detail": "Database busy, try again later"})
+
+from dependencies import REVOKED_TOKENS_REFRESH_INTERVAL, load_revoked_token_versions, refresh_revoked_token_versions
+from routers.auth_routers import auth_router, well_known_router
 from routers.order_routers import order_router
+from routers.admin_routers import admin_router
+from routers.metrics_routers import metrics_router
 
 app.include_router(auth_router)
-app.include_router(order_router)
\ No newline at end of file
+app.include_router(well_known_router)
+app.include_router(order_router)
+app.include_router(admin_router)
+app.include_router(metrics_router)
+
+from instrumentation import RequestContextMiddleware
+
+app.add_middleware(RequestContextMiddleware)
\ No newline at end of file
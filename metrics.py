@@ -0,0 +1,148 @@
+'''
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain Python objects updated on the event
+loop (one dict lookup and a bisect per observation), rendered on demand by
+GET /metrics. Values are per worker process; scrape each worker or run one.
+'''
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+ARGON2_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def set(self, value, *label_values):
+        # for values counted elsewhere and copied in at scrape time
+        self.values[label_values] = value
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield self.name, format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # per label set: [count per bucket (+Inf last), sum]
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for label_values, (counts, total) in self.values.items():
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = format_labels(self.labels + ("le",), label_values + (upper_bound,))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = format_labels(self.labels, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served."
+))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency, until the last body byte is sent.",
+    ("method", "route", "status"),
+))
+http_request_db_duration = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent executing SQL statements per HTTP request.",
+    ("method", "route"), DB_BUCKETS,
+))
+http_request_db_queries = registry.register(Counter(
+    "http_request_db_queries_total", "SQL statements executed while serving HTTP requests.",
+    ("method", "route"),
+))
+http_request_query_budget_exceeded = registry.register(Counter(
+    "http_request_query_budget_exceeded_total",
+    "Requests over QUERY_BUDGET (reason=budget) or repeating a statement QUERY_REPEAT_LIMIT times (reason=repeated).",
+    ("method", "route", "reason"),
+))
+db_pool_checkout_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time waited for a pooled database connection.",
+    buckets=DB_BUCKETS,
+))
+argon2_duration = registry.register(Histogram(
+    "argon2_duration_seconds", "Argon2 computation time on the hashing thread pool.",
+    ("operation",), ARGON2_BUCKETS,
+))
+argon2_queue_wait = registry.register(Histogram(
+    "argon2_queue_wait_seconds", "Time an Argon2 operation waited for a free hashing thread.",
+    buckets=DB_BUCKETS,
+))
+
+# copied from pool_metrics and password_hasher on every scrape
+db_pool_checked_out = registry.register(Gauge(
+    "db_pool_checked_out", "Database connections currently checked out of the pool."
+))
+db_pool_overflow = registry.register(Gauge(
+    "db_pool_overflow", "Connections open beyond DB_POOL_SIZE."
+))
+db_pool_timeouts = registry.register(Counter(
+    "db_pool_timeouts_total", "Requests rejected with 503 after DB_POOL_TIMEOUT."
+))
+argon2_pending = registry.register(Gauge(
+    "argon2_pending", "Argon2 operations running or queued on the hashing pool."
+))
+argon2_rejected = registry.register(Counter(
+    "argon2_rejected_total", "Argon2 operations rejected with 503 because the queue was full."
+))
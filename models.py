@@ -1,13 +1,108 @@
-from sqlalchemy import create_engine, Column, String, Integer, Boolean, Float, ForeignKey
+from sqlalchemy import inspect, Column, String, Integer, Boolean, Float, DateTime, LargeBinary, ForeignKey, Index, event, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
 from dotenv import load_dotenv
+from metrics import db_pool_checkout_wait
 import os
+import time
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-db = create_engine(DATABASE_URL, echo=True)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+# echoes every statement synchronously, for local debugging only
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+
+# async drivers used by the API engine (alembic keeps using DATABASE_URL as is)
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+psycopg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def get_async_database_url(database_url):
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+    return url
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool recording how long each checkout waited for a connection.
+
+    The pool events only fire once a connection has been handed out, so the
+    wait is timed around the pool's own get. Sessions check out lazily, on
+    their first statement, so only the time a request actually needs the
+    database is spent holding a connection.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        wait = time.perf_counter() - start
+        pool_metrics.record_wait(wait)
+        db_pool_checkout_wait.observe(wait)
+        return connection
+
+db = create_async_engine(
+    get_async_database_url(DATABASE_URL),
+    echo=DB_ECHO,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+SessionLocal = async_sessionmaker(bind=db, expire_on_commit=False)
+
+
+class PoolMetrics:
+    """Connection pool counters used to size DB_POOL_SIZE / DB_MAX_OVERFLOW."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def record_wait(self, seconds):
+        self.wait_count += 1
+        self.wait_time_total += seconds
+        self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def snapshot(self):
+        pool = db.pool
+        return {
+            "pool_size": pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_time_avg": self.wait_time_total / self.wait_count if self.wait_count else 0.0,
+            "wait_time_max": self.wait_time_max,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+@event.listens_for(db.sync_engine, "checkout")
+def count_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_metrics.checkouts += 1
 
 '''
 create migration: alembic revision --autogenerate -m "mensage"
@@ -17,17 +112,18 @@ execute migration: alembic upgrade head
 # link do db
 # db = create_engine("sqlite:///data.db")
 
-Base = declarative_base()
+Base = declarative_base(cls=AsyncAttrs)
 
 class User(Base):
     __tablename__ = "users"
     
     id = Column("id", Integer, primary_key=True, autoincrement=True)
     name = Column("name", String)
-    email = Column("email", String, nullable=False)
+    email = Column("email", String, nullable=False, unique=True, index=True)
     password = Column("password", String)
     activated = Column("activated", Boolean)
     admin = Column("admin", Boolean, default=False)
+    token_version = Column("token_version", Integer, nullable=False, default=0, server_default="0")
     
     def __init__(self, name, email, password, activated=True, admin=False):
         self.name = name
@@ -35,9 +131,20 @@ class User(Base):
         self.password = password
         self.activated = activated
         self.admin = admin
+
+@event.listens_for(User, "before_update")
+def bump_token_version(mapper, connection, target):
+    # tokens carry admin/activated claims, so changing either makes them stale
+    state = inspect(target)
+    if state.attrs.admin.history.has_changes() or state.attrs.activated.history.has_changes():
+        target.token_version = (target.token_version or 0) + 1
         
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_user_status", "user", "status"),
+    )
+    __mapper_args__ = {"eager_defaults": True}
     
     orders_status = (
         ("pending", "pending"),
@@ -46,9 +153,10 @@ class Order(Base):
     )
     
     id = Column("id", Integer, primary_key=True, autoincrement=True) 
-    user = Column("user", ForeignKey("users.id"))
+    user = Column("user", ForeignKey("users.id"), index=True)
     status = Column("status", String) #pending, canceled, completed
     price = Column("price", Float)
+    created_at = Column("created_at", DateTime(timezone=True), server_default=func.now(), index=True)
     itens = relationship("OrderItens", cascade="all, delete")
     
     def __init__(self, user, status="pending", price=0):
@@ -56,8 +164,13 @@ class Order(Base):
         self.status = status
         self.price = price
         
-    def calculate_price(self):
-        self.price = sum(item.unit_price * item.quantity for item in self.itens)
+    def add_item_price(self, item):
+        # applied as a delta so adding/removing an item never loads the
+        # whole collection; reconciliation.py checks it against SUM()
+        self.price = (self.price or 0) + item.unit_price * item.quantity
+        
+    def remove_item_price(self, item):
+        self.price = (self.price or 0) - item.unit_price * item.quantity
         
 class OrderItens(Base):
     __tablename__ = "order_itens"
@@ -67,7 +180,7 @@ class OrderItens(Base):
     flavor = Column("flavor", String)
     size = Column("size", String)
     unit_price = Column("unit_price", Float) 
-    order = Column("order", ForeignKey("orders.id"))
+    order = Column("order", ForeignKey("orders.id"), index=True)
     
     def __init__(self, quantity, flavor, size, unit_price, order): 
         self.quantity = quantity
@@ -76,3 +189,45 @@ class OrderItens(Base):
         self.unit_price = unit_price
         self.order = order
         
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    key = Column("key", String(64), primary_key=True)
+    request_hash = Column("request_hash", String(64), nullable=False)
+    status_code = Column("status_code", Integer) # null while the request is in progress
+    response_body = Column("response_body", LargeBinary)
+    media_type = Column("media_type", String)
+    created_at = Column("created_at", Float, nullable=False, index=True) # unix timestamp, pruned after IDEMPOTENCY_TTL
+    
+    def __init__(self, key, request_hash, created_at):
+        self.key = key
+        self.request_hash = request_hash
+        self.created_at = created_at
+        
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    
+    jti = Column("jti", String(32), primary_key=True)
+    family = Column("family", String(32), nullable=False, index=True) # tokens rotated from the same login
+    user = Column("user", ForeignKey("users.id"), nullable=False, index=True)
+    expires_at = Column("expires_at", Float, nullable=False) # unix timestamp
+    used = Column("used", Boolean, nullable=False, default=False)
+    
+    def __init__(self, jti, family, user, expires_at, used=False):
+        self.jti = jti
+        self.family = family
+        self.user = user
+        self.expires_at = expires_at
+        self.used = used
+        
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+    
+    key = Column("key", String, primary_key=True)
+    tokens = Column("tokens", Float, nullable=False)
+    updated_at = Column("updated_at", Float, nullable=False, index=True) # unix timestamp
+    
+    def __init__(self, key, tokens, updated_at):
+        self.key = key
+        self.tokens = tokens
+        self.updated_at = updated_at
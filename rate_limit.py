@@ -0,0 +1,113 @@
+import math
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from models import RateLimitBucket, SessionLocal
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", 20))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", 10))
+LOGIN_EMAIL_BURST = float(os.getenv("LOGIN_EMAIL_BURST", 5))
+LOGIN_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_EMAIL_PER_MINUTE", 2))
+# minimum seconds between deletions of full buckets by the database backend
+RATE_LIMIT_PRUNE_INTERVAL = float(os.getenv("RATE_LIMIT_PRUNE_INTERVAL", 60))
+
+
+def refill(tokens, updated_at, now, capacity, refill_rate):
+    """Token bucket step: returns (allowed, tokens left, seconds until the next token)."""
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * refill_rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / refill_rate
+
+
+class MemoryRateLimitBackend:
+    """Per-process buckets, bounded to `maxsize` keys (least recently used go first)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.buckets = OrderedDict()
+
+    async def consume(self, key, capacity, refill_rate):
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.get(key, (capacity, now))
+        allowed, tokens, retry_after = refill(tokens, updated_at, now, capacity, refill_rate)
+        self.buckets[key] = (tokens, now)
+        self.buckets.move_to_end(key)
+        while len(self.buckets) > self.maxsize:
+            self.buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+class DatabaseRateLimitBackend:
+    """Buckets in the rate_limit_buckets table, shared by every worker.
+
+    A bucket left alone for capacity / refill_rate seconds is full again, the
+    same as a missing one, so such rows are deleted (at most once every
+    `prune_interval` seconds per worker) and random emails can't grow the
+    table without bound.
+    """
+
+    def __init__(self, prune_interval):
+        self.prune_interval = prune_interval
+        self.pruned_at = 0.0
+        # longest time to refill any bucket this worker has seen
+        self.refill_time = 0.0
+
+    async def consume(self, key, capacity, refill_rate):
+        self.refill_time = max(self.refill_time, capacity / refill_rate)
+        async with SessionLocal() as session:
+            now = time.time()
+            if time.monotonic() - self.pruned_at >= self.prune_interval:
+                self.pruned_at = time.monotonic()
+                await session.execute(delete(RateLimitBucket).where(RateLimitBucket.updated_at < now - self.refill_time))
+            result = await session.execute(
+                select(RateLimitBucket).where(RateLimitBucket.key == key).with_for_update()
+            )
+            bucket = result.scalars().first()
+            if bucket is None:
+                allowed, tokens, retry_after = refill(capacity, now, now, capacity, refill_rate)
+                session.add(RateLimitBucket(key, tokens, now))
+                try:
+                    await session.commit()
+                except IntegrityError:
+                    # another worker created the bucket first, count against it
+                    await session.rollback()
+                    return await self.consume(key, capacity, refill_rate)
+                return allowed, retry_after
+            allowed, bucket.tokens, retry_after = refill(bucket.tokens, bucket.updated_at, now, capacity, refill_rate)
+            bucket.updated_at = now
+            await session.commit()
+            return allowed, retry_after
+
+
+def get_rate_limit_backend():
+    if RATE_LIMIT_BACKEND == "database":
+        return DatabaseRateLimitBackend(RATE_LIMIT_PRUNE_INTERVAL)
+    return MemoryRateLimitBackend(RATE_LIMIT_MAX_KEYS)
+
+
+rate_limit_backend = get_rate_limit_backend()
+
+
+async def check_login_rate_limit(request, email):
+    # runs before authenticate_user so throttled attempts cost no Argon2 work
+    client_ip = request.client.host if request.client else "unknown"
+    limits = [
+        (f"login:ip:{client_ip}", LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE / 60),
+        (f"login:email:{email.strip().lower()}", LOGIN_EMAIL_BURST, LOGIN_EMAIL_PER_MINUTE / 60),
+    ]
+    for key, capacity, refill_rate in limits:
+        allowed, retry_after = await rate_limit_backend.consume(key, capacity, refill_rate)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many login attempts, try again later.",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
@@ -0,0 +1,63 @@
+'''
+Order price reconciliation job.
+
+Order prices are maintained incrementally when items are added or removed.
+This job recomputes every total with a single SUM(unit_price * quantity)
+aggregate and reports (or fixes) the orders whose stored price drifted.
+
+run: python reconciliation.py [--fix]
+'''
+import argparse
+import asyncio
+
+from sqlalchemy import func, select, update
+
+from models import Order, OrderItens, SessionLocal, db
+
+PRICE_TOLERANCE = 1e-6
+
+
+async def find_price_mismatches(session):
+    total = func.coalesce(func.sum(OrderItens.unit_price * OrderItens.quantity), 0)
+    query = (
+        select(Order.id, Order.price, total.label("expected_price"))
+        .outerjoin(OrderItens, OrderItens.order == Order.id)
+        .group_by(Order.id, Order.price)
+        .having(func.abs(func.coalesce(Order.price, 0) - total) > PRICE_TOLERANCE)
+        .order_by(Order.id)
+    )
+    result = await session.execute(query)
+    return [
+        {"order_id": row.id, "stored_price": row.price, "expected_price": row.expected_price}
+        for row in result
+    ]
+
+
+async def reconcile_prices(session, fix=False):
+    mismatches = await find_price_mismatches(session)
+    if fix and mismatches:
+        for mismatch in mismatches:
+            await session.execute(
+                update(Order)
+                .where(Order.id == mismatch["order_id"])
+                .values(price=mismatch["expected_price"])
+            )
+        await session.commit()
+    return mismatches
+
+
+async def main(fix):
+    async with SessionLocal() as session:
+        mismatches = await reconcile_prices(session, fix)
+    await db.dispose()
+    for mismatch in mismatches:
+        print(f"order {mismatch['order_id']}: stored {mismatch['stored_price']} expected {mismatch['expected_price']}")
+    action = "fixed" if fix else "found"
+    print(f"{len(mismatches)} price mismatch(es) {action}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fix", action="store_true", help="overwrite drifted prices with the recomputed totals")
+    args = parser.parse_args()
+    asyncio.run(main(args.fix))
@@ -0,0 +1,177 @@
+from fastapi import APIRouter, Depends, HTTPException
+from dependencies import get_session, verify_token, user_cache, token_cache
+from models import User, pool_metrics
+from reconciliation import reconcile_prices
+from jwt_keys import key_ring
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+admin_router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(verify_token)])
+
+@admin_router.get("/pool")
+async def pool_status(user: User = Depends(verify_token)):
+    """
+    Report database connection pool usage.
+
+    This endpoint exposes the current state of the SQLAlchemy connection pool
+    together with checkout counters collected since the process started. It is
+    meant to help size `DB_POOL_SIZE` and `DB_MAX_OVERFLOW` for the number of
+    workers running the API. Access is restricted to admin users only.
+
+    Args:
+        user (User): The authenticated user obtained from the JWT token.
+
+    Raises:
+        HTTPException: If the user is not an admin (status code 403).
+
+    Returns:
+        dict: A JSON object containing pool size, connections checked in/out,
+        current overflow, total checkouts, pool timeouts and the average and
+        maximum time (in seconds) spent waiting for a connection.
+    """
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
+    return pool_metrics.snapshot()
+
+@admin_router.get("/cache")
+async def cache_status(user: User = Depends(verify_token)):
+    """
+    Report in-process cache usage.
+
+    This endpoint exposes the size, limits and hit/miss counters of the
+    authenticated-user cache and the decoded-token cache used by
+    `verify_token`. The counters are per worker process. Access is
+    restricted to admin users only.
+
+    Args:
+        user (User): The authenticated user obtained from the JWT token.
+
+    Raises:
+        HTTPException: If the user is not an admin (status code 403).
+
+    Returns:
+        dict: A JSON object containing:
+            - `user_cache` (dict): Size, max size, TTL, hits and misses.
+            - `token_cache` (dict): Size, max size, TTL, hits and misses.
+    """
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
+    return {"user_cache": user_cache.stats(), "token_cache": token_cache.stats()}
+
+@admin_router.post("/reconcile_prices")
+async def reconcile_order_prices(
+    fix: bool = False,
+    user: User = Depends(verify_token),
+    session: AsyncSession = Depends(get_session)
+    ):
+    """
+    Verify stored order prices against their items.
+
+    Order prices are updated incrementally as items are added or removed.
+    This endpoint recomputes every order total with a single SQL aggregate and
+    lists the orders whose stored price differs. When `fix` is true, the
+    drifted prices are overwritten with the recomputed totals. Access is
+    restricted to admin users only.
+
+    Args:
+        fix (bool): Whether to correct the mismatched prices (default False).
+        user (User): The authenticated user obtained from the JWT token.
+        session (AsyncSession): SQLAlchemy async database session dependency.
+
+    Raises:
+        HTTPException: If the user is not an admin (status code 403).
+
+    Returns:
+        dict: A JSON object containing:
+            - `mismatches` (list): The `order_id`, `stored_price` and
+              `expected_price` of every order whose price drifted.
+            - `fixed` (bool): Whether the mismatches were corrected.
+    """
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
+    mismatches = await reconcile_prices(session, fix)
+    return {"mismatches": mismatches, "fixed": fix}
+
+@admin_router.post("/revoke_tokens/{user_id}")
+async def revoke_tokens(
+    user_id: int,
+    user: User = Depends(verify_token),
+    session: AsyncSession = Depends(get_session)
+    ):
+    """
+    Revoke every token issued to a user.
+
+    This endpoint increments the user's token version. Tokens carrying an
+    older `ver` claim are then rejected by the stateless verification mode
+    (`STATELESS_AUTH=true`), and the user's cached record is dropped. Tokens
+    are also revoked automatically when a user's `admin` or `activated` flag
+    changes. Access is restricted to admin users only.
+
+    Args:
+        user_id (int): The ID of the user whose tokens are revoked.
+        user (User): The authenticated user obtained from the JWT token.
+        session (AsyncSession): SQLAlchemy async database session dependency.
+
+    Raises:
+        HTTPException: If the user is not an admin (status code 403).
+        HTTPException: If the target user does not exist (status code 400).
+
+    Returns:
+        dict: A JSON object containing a confirmation message and the new
+        `token_version` of the user.
+    """
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
+    result = await session.execute(select(User).where(User.id == user_id))
+    target_user = result.scalars().first()
+    if not target_user:
+        raise HTTPException(status_code=400, detail="User not found.")
+    target_user.token_version = (target_user.token_version or 0) + 1
+    await session.commit()
+    return {
+        "response": f"Tokens of user {user_id} revoked successfully.",
+        "token_version": target_user.token_version
+    }
+
+@admin_router.post("/reload_keys")
+async def reload_keys(
+    active_kid: Optional[str] = None,
+    user: User = Depends(verify_token)
+    ):
+    """
+    Reload the JWT signing keys from `JWT_KEYS_DIR`.
+
+    This endpoint supports key rotation without a restart: add the new key
+    file, reload with the new `active_kid` to start signing with it, and remove
+    the old file (then reload again) once the tokens it signed have expired.
+    Every key in the directory keeps verifying tokens and is published at
+    `/.well-known/jwks.json`. The decoded-token cache is cleared so tokens
+    signed by a removed key stop being accepted immediately. This only affects
+    the worker process that handles the request. Access is restricted to admin
+    users only.
+
+    Args:
+        active_kid (str, optional): The key ID to sign new tokens with. Defaults
+            to the current active key, or the last private key by name.
+        user (User): The authenticated user obtained from the JWT token.
+
+    Raises:
+        HTTPException: If the user is not an admin (status code 403).
+        HTTPException: If the keys cannot be loaded (status code 400).
+
+    Returns:
+        dict: A JSON object containing the active `kid` and all loaded `kids`.
+    """
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
+    previous_kid = key_ring.active_kid
+    if active_kid is not None:
+        key_ring.active_kid = active_kid
+    try:
+        key_ring.load()
+    except (OSError, RuntimeError, ValueError) as error:
+        key_ring.active_kid = previous_kid
+        raise HTTPException(status_code=400, detail=str(error))
+    token_cache.clear()
+    return {"active_kid": key_ring.signing_kid, "kids": [kid for kid in key_ring.verification_keys]}
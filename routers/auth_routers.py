@@ -1,29 +1,73 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from models import User
-from dependencies import get_session, verify_token
-from main import argon2_context, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from models import User, RefreshToken
+from dependencies import get_session, verify_token, decode_token, user_cache
+from main import ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS, oath2_schema
+from jwt_keys import key_ring
 from schemas import UserSchema, LoginSchema
-from sqlalchemy.orm import Session
-from jose import jwt, JWTError
+from security import password_hasher, known_emails, KNOWN_EMAILS_FILTER
+from rate_limit import check_login_rate_limit
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta, timezone
+import secrets
+import time
 
 auth_router = APIRouter(prefix="/auth", tags=["Auth"])
+well_known_router = APIRouter(prefix="/.well-known", tags=["Auth"])
 
-def get_token(user_id, token_time=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)):
+def get_token(user, token_time=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES), token_type="access", extra_claims=None):
     expiration_date = datetime.now(timezone.utc) + token_time
     expiration_date_timestamp = int(expiration_date.timestamp())
-    dict_info = {"sub": str(user_id), "exp": expiration_date_timestamp}
-    encoded_jwt = jwt.encode(dict_info, SECRET_KEY, ALGORITHM)
+    # admin/activated/ver claims let verify_token_claims authorize without a DB lookup
+    dict_info = {
+        "sub": str(user.id),
+        "exp": expiration_date_timestamp,
+        "typ": token_type,
+        "admin": bool(user.admin),
+        "activated": bool(user.activated),
+        "ver": user.token_version or 0,
+    }
+    if extra_claims:
+        dict_info.update(extra_claims)
+    encoded_jwt = key_ring.encode(dict_info)
     return encoded_jwt
 
 
-def authenticate_user(email, password, session):
-    user = session.query(User).filter(User.email == email).first()
+def get_refresh_token(user, session, family=None):
+    # every refresh token is single use: its jti is stored and marked used when
+    # rotated, and all tokens of a login share a family that is revoked as a
+    # whole if a used token shows up again
+    token_time = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    jti = secrets.token_hex(16)
+    family = family or secrets.token_hex(16)
+    session.add(RefreshToken(jti, family, user.id, time.time() + token_time.total_seconds()))
+    return get_token(user, token_time, "refresh", {"jti": jti, "fam": family})
+
+
+async def authenticate_user(email, password, session):
+    # refuse before taking a pooled connection when the hashing queue is full
+    password_hasher.check_capacity()
+    # unknown emails are rejected without querying users when the bloom filter
+    # rules them out, and always pay a dummy Argon2 verify so their response
+    # time matches a wrong password
+    user = None
+    if not KNOWN_EMAILS_FILTER or await known_emails.may_contain(email, session):
+        result = await session.execute(select(User).where(User.email == email))
+        user = result.scalars().first()
+    # give the connection back before queueing for Argon2, so a login storm
+    # fills the hashing queue (503) instead of the pool the order routes use
+    await session.commit()
     if not user:
+        return await password_hasher.verify_dummy(password)
+    valid, new_hash = await password_hasher.verify_and_update(password, user.password)
+    if not valid:
         return False
-    elif not argon2_context.verify(password, user.password):
-        return False
+    if new_hash:
+        # stored hash predates the current ARGON2_* profile, upgrade it now
+        # that the plain password is at hand (checks a connection out again)
+        user.password = new_hash
+        await session.commit()
     return user
 
 
@@ -46,7 +90,7 @@ async def home():
 @auth_router.post("/signup")
 async def signup(
     user_schema: UserSchema,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(verify_token) 
 ):
     """
@@ -64,7 +108,7 @@ async def signup(
     Args:
         user_schema (UserSchema): The user data payload containing name, email,
             password, activation status, and admin flag.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
         current_user (User): The currently authenticated user (used to verify
             admin privileges).
 
@@ -75,41 +119,50 @@ async def signup(
     Returns:
         dict: A confirmation message indicating successful user registration.
     """
-    existing_user = session.query(User).filter(User.email == user_schema.email).first()
+    result = await session.execute(select(User).where(User.email == user_schema.email))
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="This user already exists with this email.")
     
-    admin_user = session.query(User).filter(User.admin == True).first()
+    result = await session.execute(select(User).where(User.admin == True))
+    admin_user = result.scalars().first()
     if admin_user and user_schema.admin:
         if not current_user or not current_user.admin:
             raise HTTPException(status_code=403, detail="Only admins can create new admin users.")
 
-    hash_password = argon2_context.hash(user_schema.password)
+    # don't hold a pooled connection while waiting for Argon2
+    await session.commit()
+    hash_password = await password_hasher.hash(user_schema.password)
     new_user = User(user_schema.name, user_schema.email, hash_password, user_schema.activated, user_schema.admin)
     session.add(new_user)
-    session.commit()
+    await session.commit()
+    known_emails.add(new_user.email)
     return {"response": f"User {user_schema.email} registered successfully."}
     
 @auth_router.post("/signup_admin")
 async def signup(
     user_schema: UserSchema,
-    session: Session = Depends(get_session), 
+    session: AsyncSession = Depends(get_session), 
 ):
 
-    existing_user = session.query(User).filter(User.email == user_schema.email).first()
+    result = await session.execute(select(User).where(User.email == user_schema.email))
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="This user already exists with this email.")
     else:
-        hash_password = argon2_context.hash(user_schema.password[:72])
+        await session.commit()
+        hash_password = await password_hasher.hash(user_schema.password[:72])
         new_user = User(user_schema.name, user_schema.email, hash_password, user_schema.activated, user_schema.admin)
         session.add(new_user)
-        session.commit()
+        await session.commit()
+        known_emails.add(new_user.email)
         return {"response": f"User {user_schema.email} registered successfully."}
     
 @auth_router.post("/login")
 async def login(
+    request: Request,
     login_schema: LoginSchema,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
     ):
     """Authenticate a user and issue access tokens.
 
@@ -121,25 +174,34 @@ async def login(
     while the refresh token allows the client to request a new access token
     without re-entering credentials.
 
+    Attempts are rate limited per client IP and per email (token buckets)
+    before any password hashing is done.
+
     Args:
+        request (Request): The incoming request, used to identify the client IP.
         login_schema (LoginSchema): The login credentials, including email and password.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
 
     Raises:
         HTTPException: If the user is not found or the password is invalid (status code 400).
+        HTTPException: If too many attempts were made for this IP or email (status code 429).
 
     Returns:
         dict: A JSON object containing:
             - `access_token` (str): The short-term JWT access token.
-            - `refresh_token` (str): The long-term JWT refresh token (valid for 7 days).
+            - `refresh_token` (str): The single-use JWT refresh token (valid for
+              `REFRESH_TOKEN_EXPIRE_DAYS`, 7 days by default).
             - `token_type` (str): The type of token, always `"Bearer"`.
     """
-    user = authenticate_user(login_schema.email, login_schema.password, session)
+    await check_login_rate_limit(request, login_schema.email)
+    user = await authenticate_user(login_schema.email, login_schema.password, session)
     if not user:
         raise HTTPException(status_code=400, detail="User not found or invalid password.")
     else:
-        access_token = get_token(user.id)
-        refresh_token = get_token(user.id, timedelta(days=7))
+        access_token = get_token(user)
+        await session.execute(delete(RefreshToken).where(RefreshToken.user == user.id, RefreshToken.expires_at < time.time()))
+        refresh_token = get_refresh_token(user, session)
+        await session.commit()
         return {
             "access_token": access_token,
             "refresh_token": refresh_token,
@@ -148,8 +210,9 @@ async def login(
 
 @auth_router.post("/login_form")
 async def login_form(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
     ):
     """
     Authenticate a user using form-based credentials and return an access token.
@@ -162,51 +225,111 @@ async def login_form(
     This route is commonly used for browser-based or OAuth2-compliant clients
     that submit login information via `application/x-www-form-urlencoded`.
 
+    Attempts are rate limited per client IP and per email (token buckets)
+    before any password hashing is done.
+
     Args:
+        request (Request): The incoming request, used to identify the client IP.
         form_data (OAuth2PasswordRequestForm): The form data containing the
             username (email) and password fields.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
 
     Raises:
         HTTPException: If the user is not found or the password is invalid (status code 400).
+        HTTPException: If too many attempts were made for this IP or email (status code 429).
 
     Returns:
         dict: A JSON object containing:
             - `access_token` (str): The JWT access token for authenticated requests.
             - `token_type` (str): The type of token, always `"Bearer"`.
     """
-    user = authenticate_user(form_data.username, form_data.password, session)
+    await check_login_rate_limit(request, form_data.username)
+    user = await authenticate_user(form_data.username, form_data.password, session)
     if not user:
         raise HTTPException(status_code=400, detail="User not found or invalid password.")
     else:
-        access_token = get_token(user.id)
+        access_token = get_token(user)
         return {
             "access_token": access_token,
             "token_type": "Bearer"
             }
         
-@auth_router.get("/refresh")
-async def user_refresh_token(user: User = Depends(verify_token)):
+@auth_router.api_route("/refresh", methods=["GET", "POST"])
+async def user_refresh_token(
+    token: str = Depends(oath2_schema),
+    session: AsyncSession = Depends(get_session)
+    ):
     """
-    Refresh the user's access token.
+    Exchange a refresh token for a new access token and refresh token.
 
-    This endpoint generates a new short-term access token for an authenticated user.
-    It requires a valid refresh token or an existing authentication token to be
-    provided via dependency injection (`verify_token`).
+    This endpoint only accepts refresh tokens (`typ` claim `"refresh"`) issued
+    by `/auth/login`, sent as `Authorization: Bearer <refresh_token>`. Refresh
+    tokens are single use: each call marks the presented token as used and
+    returns a new one (rotation). Presenting an already used refresh token is
+    treated as token theft, and every refresh token from the same login is
+    revoked.
 
     The refreshed access token allows the user to maintain an active session
     without re-entering login credentials.
 
     Args:
-        user (User): The authenticated user extracted from the current valid token.
+        token (str): The refresh token from the `Authorization` header.
+        session (AsyncSession): SQLAlchemy async database session dependency.
+
+    Raises:
+        HTTPException: If the token is not a valid, unused refresh token, or
+            its user no longer exists or had its tokens revoked (status code 401).
 
     Returns:
         dict: A JSON object containing:
             - `access_token` (str): A newly issued JWT access token.
+            - `refresh_token` (str): The new refresh token, replacing the one sent.
             - `token_type` (str): The type of token, always `"Bearer"`.
     """
-    access_token = get_token(user.id)
+    dict_info = decode_token(token)
+    if dict_info.get("typ") != "refresh" or "jti" not in dict_info or "fam" not in dict_info:
+        raise HTTPException(status_code=401, detail="Access denied, check token validity")
+    result = await session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.jti == dict_info["jti"], RefreshToken.used == False)
+        .values(used=True)
+    )
+    if result.rowcount != 1:
+        # unknown or already rotated: revoke the whole login
+        await session.execute(delete(RefreshToken).where(RefreshToken.family == dict_info["fam"]))
+        await session.commit()
+        raise HTTPException(status_code=401, detail="Refresh token reuse detected, log in again")
+    user_id = int(dict_info["sub"])
+    user = user_cache.get(user_id)
+    if user is None:
+        result = await session.execute(select(User).where(User.id == user_id))
+        user = result.scalars().first()
+    if not user or (user.token_version or 0) > dict_info.get("ver", 0):
+        await session.commit()
+        raise HTTPException(status_code=401, detail="Invalid access")
+    access_token = get_token(user)
+    refresh_token = get_refresh_token(user, session, dict_info["fam"])
+    await session.commit()
     return {
             "access_token": access_token,
+            "refresh_token": refresh_token,
             "token_type": "Bearer"
-            }
\ No newline at end of file
+            }
+
+@well_known_router.get("/jwks.json")
+async def jwks(response: Response):
+    """
+    Publish the public keys used to sign access tokens.
+
+    This endpoint returns a JSON Web Key Set (RFC 7517) with the public half of
+    every active signing key, identified by its `kid`. Other services (such as
+    an edge gateway) can use it to validate tokens issued by this API locally,
+    without calling back into it. When tokens are signed with a symmetric
+    algorithm (HS256), no key is published and the list is empty.
+
+    Returns:
+        dict: A JSON object containing:
+            - `keys` (list): The public JWKs, with `kid`, `kty`, `alg` and `use`.
+    """
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return key_ring.jwks()
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Header, HTTPException, Response
+from metrics import registry, db_pool_checked_out, db_pool_overflow, db_pool_timeouts, argon2_pending, argon2_rejected
+from models import pool_metrics
+from security import password_hasher
+from typing import Optional
+import os
+import secrets
+
+# when set, scrapers must send "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+metrics_router = APIRouter(tags=["Metrics"])
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """
+    Expose process metrics in the Prometheus text format.
+
+    This endpoint renders every metric collected by this worker process:
+    request latency histograms per route and status, requests in flight,
+    SQL time and statement counts per route, connection pool checkout waits
+    and Argon2 hashing time. Pool and hashing pool gauges are refreshed at
+    scrape time. It does not use JWT authentication so a Prometheus scraper
+    can reach it; set `METRICS_TOKEN` to require a static bearer token.
+
+    Args:
+        authorization (str, optional): The Authorization header, checked only
+            when `METRICS_TOKEN` is set.
+
+    Raises:
+        HTTPException: If `METRICS_TOKEN` is set and the header does not
+            carry it (status code 401).
+
+    Returns:
+        Response: The metrics in the text exposition format (version 0.0.4).
+    """
+    if METRICS_TOKEN and not secrets.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    pool = pool_metrics.snapshot()
+    db_pool_checked_out.set(pool["checked_out"])
+    db_pool_overflow.set(max(0, pool["overflow"]))
+    db_pool_timeouts.set(pool["timeouts"])
+    argon2_pending.set(password_hasher.pending)
+    argon2_rejected.set(password_hasher.rejected)
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,11 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException
-from dependencies import get_session, verify_token
-from sqlalchemy.orm import Session
-from schemas import OrderSchema, OrderItemSchema, ResponseOrderSchema
-from models import Order, User, OrderItens
-from typing import List
-
-order_router = APIRouter(prefix="/orders", tags=["Orders"], dependencies=[Depends(verify_token)])
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from dependencies import get_session, verify_token, verify_token_read
+from idempotency import IdempotentRoute
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from schemas import OrderSchema, OrderItemSchema, OrderItemsBulkSchema, OrderWithItemsSchema, OrderFilterSchema, OrderListFilterSchema, OrderExportFilterSchema, ResponseOrderPageSchema, ResponseCreateOrderSchema, ResponseGetOrderSchema, ResponseRemoveItemSchema
+from models import Order, User, OrderItens, SessionLocal
+from typing import Annotated
+from datetime import datetime, time, timedelta, timezone
+import csv
+import io
+import json
+
+# POST routes honor the Idempotency-Key header, see idempotency.py
+order_router = APIRouter(prefix="/orders", tags=["Orders"], dependencies=[Depends(verify_token_read)], route_class=IdempotentRoute)
+
+# loads Order.itens with one extra "WHERE order IN (...)" query instead of
+# a lazy load per order when the items are read
+WITH_ITENS = selectinload(Order.itens)
+
+def filter_orders(query, filters):
+    if filters.status is not None:
+        query = query.where(Order.status == filters.status)
+    if filters.min_price is not None:
+        query = query.where(Order.price >= filters.min_price)
+    if filters.max_price is not None:
+        query = query.where(Order.price <= filters.max_price)
+    return query
+
+async def paginate_orders(query, filters, session):
+    # keyset pagination on the primary key: each page is an index range scan
+    # starting after the last id the client saw, no OFFSET involved
+    if filters.cursor is not None:
+        query = query.where(Order.id > filters.cursor)
+    result = await session.execute(query.order_by(Order.id).limit(filters.limit + 1))
+    orders_list = result.scalars().all()
+    if len(orders_list) > filters.limit:
+        orders_list = orders_list[:filters.limit]
+        return orders_list, orders_list[-1].id
+    return orders_list, None
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ("id", "user", "status", "price", "created_at")
+
+def export_row(row):
+    order = row._asdict()
+    if order["created_at"] is not None:
+        order["created_at"] = order["created_at"].isoformat()
+    return order
+
+async def stream_orders(query, export_format):
+    # the request session is already closed once the response starts streaming,
+    # so the export owns its session; plain column rows fetched in batches from
+    # a server-side cursor keep memory flat regardless of the table size
+    async with SessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+            writer.writeheader()
+            async for partition in result.partitions():
+                for row in partition:
+                    writer.writerow(export_row(row))
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            async for partition in result.partitions():
+                yield "".join(json.dumps(export_row(row)) + "\n" for row in partition)
 
 @order_router.get("/")
 async def orders():
@@ -26,7 +91,7 @@ async def orders():
 async def order(
     order_schema: OrderSchema,
     user: User = Depends(verify_token), 
-    session: Session =  Depends(get_session)
+    session: AsyncSession = Depends(get_session)
     ):
     """
     Create a new order.
@@ -40,7 +105,7 @@ async def order(
     Args:
         order_schema (OrderSchema): The payload containing order data, including the `user_id`.
         user (User): The authenticated user making the request, obtained from the JWT token.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
 
     Raises:
         HTTPException: If a non-admin user attempts to create an order for another user (status code 403).
@@ -53,79 +118,211 @@ async def order(
     else:
         new_order = Order(user=order_schema.user_id)
         session.add(new_order)
-        session.commit()
+        await session.commit()
         return {"response": f"Order created successfully. Order ID: {new_order.id}"}
 
+@order_router.post("/order/with_items", response_model=ResponseCreateOrderSchema)
+async def order_with_itens(
+    order_schema: OrderWithItemsSchema,
+    user: User = Depends(verify_token), 
+    session: AsyncSession = Depends(get_session)
+    ):
+    """
+    Create a new order together with its items.
+
+    This endpoint creates an order and all of its items (up to 100) in a single
+    transaction, replacing the `POST /orders/order` plus repeated
+    `POST /orders/order/add_item/{order_id}` round-trips. The order and its
+    items are written with two INSERTs in one transaction, so either the whole
+    order is created or nothing is. Only administrators or users creating an order for
+    themselves are authorized to perform this action.
+
+    Args:
+        order_schema (OrderWithItemsSchema): The payload containing the `user_id`
+            and the `itens` list, each with quantity, flavor, size, and unit price.
+        user (User): The authenticated user making the request, obtained from the JWT token.
+        session (AsyncSession): SQLAlchemy async database session dependency.
+
+    Raises:
+        HTTPException: If a non-admin user attempts to create an order for another user (status code 403).
+
+    Returns:
+        dict: A JSON object containing:
+            - `response` (str): Confirmation message with the new order ID.
+            - `order` (ResponseOrderDetailSchema): The created order, including its items and total price.
+    """
+    if not user.admin and user.id != order_schema.user_id:
+        raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
+    new_order = Order(user=order_schema.user_id)
+    for item in order_schema.itens:
+        new_order.add_item_price(item)
+    session.add(new_order)
+    await session.flush()
+    # a bulk INSERT ... RETURNING keeps this at one items statement on every
+    # backend; appending to new_order.itens made the unit of work fall back
+    # to one INSERT per item where RETURNING can't be batched (SQLite)
+    result = await session.scalars(
+        insert(OrderItens).returning(OrderItens),
+        [
+            {
+                "quantity": item.quantity,
+                "flavor": item.flavor,
+                "size": str(item.size),
+                "unit_price": item.unit_price,
+                "order": new_order.id
+            }
+            for item in order_schema.itens
+        ]
+    )
+    set_committed_value(new_order, "itens", sorted(result.all(), key=lambda order_item: order_item.id))
+    await session.commit()
+    return {
+        "response": f"Order created successfully. Order ID: {new_order.id}",
+        "order": new_order
+    }
+
     
 @order_router.get("/list")
 async def list_orders(
-    user: User = Depends(verify_token), 
-    session: Session =  Depends(get_session)
+    filters: Annotated[OrderListFilterSchema, Query()],
+    user: User = Depends(verify_token_read), 
+    session: AsyncSession = Depends(get_session)
     ):
     """
-    Retrieve the list of all orders.
+    Retrieve a page of orders.
 
-    This endpoint returns all orders stored in the database.  
-    Access is restricted to admin users only — non-admin users
+    This endpoint returns orders stored in the database, ordered by ID and
+    paginated with a keyset cursor. Results can be filtered by status, owner
+    and price range. Access is restricted to admin users only — non-admin users
     attempting to access this route will receive a 403 Forbidden error.
 
+    To fetch the next page, send the returned `next_cursor` back as `cursor`.
+
     Args:
+        filters (OrderListFilterSchema): Query parameters `cursor` (last order
+            ID already seen), `limit` (page size, capped at 200), `status`,
+            `user_id`, `min_price` and `max_price`.
         user (User): The authenticated user obtained from the JWT token.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
 
     Raises:
         HTTPException: If the user is not an admin (status code 403).
 
     Returns:
         dict: A JSON object containing:
-            - `orders_list` (list): A list of all order records from the database.
+            - `orders_list` (list): The order records in this page.
+            - `next_cursor` (int | None): The cursor for the next page, or
+              `None` when there are no more orders.
     """
     if not user.admin:
         raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
     else:
-        orders_list = session.query(Order).all()
+        query = filter_orders(select(Order), filters)
+        if filters.user_id is not None:
+            query = query.where(Order.user == filters.user_id)
+        orders_list, next_cursor = await paginate_orders(query, filters, session)
         return {
-            "orders_list": orders_list
+            "orders_list": orders_list,
+            "next_cursor": next_cursor
         }
 
-@order_router.get("/list/orders_user/{user_id}", response_model=List[ResponseOrderSchema])
+@order_router.get("/export")
+async def export_orders(
+    filters: Annotated[OrderExportFilterSchema, Query()],
+    user: User = Depends(verify_token_read)
+    ):
+    """
+    Stream the order history as NDJSON or CSV.
+
+    This endpoint exports every order matching the filters without loading
+    them all in memory: rows are read from the database in batches and written
+    to the response as they arrive, so memory use stays constant regardless of
+    the size of the table. Access is restricted to admin users only.
+
+    Args:
+        filters (OrderExportFilterSchema): Query parameters `format`
+            (`ndjson` or `csv`, default `ndjson`), `status`, `created_from`
+            and `created_to` (ISO 8601 dates, e.g. `2026-10-16`, both days
+            included, in UTC).
+        user (User): The authenticated user obtained from the JWT token.
+
+    Raises:
+        HTTPException: If the user is not an admin (status code 403).
+
+    Returns:
+        StreamingResponse: One order per line with the fields `id`, `user`,
+        `status`, `price` and `created_at`.
+    """
+    if not user.admin:
+        raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
+    query = select(*(getattr(Order, column) for column in EXPORT_COLUMNS)).order_by(Order.id)
+    if filters.status is not None:
+        query = query.where(Order.status == filters.status)
+    if filters.created_from is not None:
+        query = query.where(Order.created_at >= datetime.combine(filters.created_from, time.min, timezone.utc))
+    if filters.created_to is not None:
+        # bounded by the start of the next day so all of created_to is included
+        next_day = filters.created_to + timedelta(days=1)
+        query = query.where(Order.created_at < datetime.combine(next_day, time.min, timezone.utc))
+    if filters.format == "csv":
+        media_type = "text/csv"
+    else:
+        media_type = "application/x-ndjson"
+    return StreamingResponse(
+        stream_orders(query, filters.format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=orders.{filters.format}"}
+    )
+
+@order_router.get("/list/orders_user/{user_id}", response_model=ResponseOrderPageSchema)
 async def list_user_orders(
     user_id: int,
-    user: User = Depends(verify_token), 
-    session: Session =  Depends(get_session)
+    filters: Annotated[OrderFilterSchema, Query()],
+    user: User = Depends(verify_token_read), 
+    session: AsyncSession = Depends(get_session)
     ):
     """
-    Retrieve all orders for a specific user.
+    Retrieve a page of orders for a specific user.
 
-    This endpoint returns all orders associated with the given `user_id`.  
-    Access is restricted to either the user themselves or an admin user.
-    Non-admin users attempting to access orders of other users will receive
-    a 403 Forbidden error.
+    This endpoint returns orders associated with the given `user_id`, ordered
+    by ID and paginated with a keyset cursor, optionally filtered by status and
+    price range. Access is restricted to either the user themselves or an admin
+    user. Non-admin users attempting to access orders of other users will
+    receive a 403 Forbidden error.
+
+    To fetch the next page, send the returned `next_cursor` back as `cursor`.
 
     Args:
         user_id (int): The ID of the user whose orders are being requested.
+        filters (OrderFilterSchema): Query parameters `cursor` (last order ID
+            already seen), `limit` (page size, capped at 200), `status`,
+            `min_price` and `max_price`.
         user (User): The authenticated user obtained from the JWT token.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
 
     Raises:
         HTTPException: If the authenticated user is not an admin and
             attempts to access another user's orders (status code 403).
 
     Returns:
-        List[ResponseOrderSchema]: A list of order records for the specified user,
-        serialized according to the `ResponseOrderSchema`.
+        ResponseOrderPageSchema: The order records in this page, serialized
+        according to the `ResponseOrderSchema`, and the `next_cursor`.
     """
     if not user.admin and user.id != user_id:
         raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
     else:
-        user_orders_list = session.query(Order).filter(Order.user == user_id).all()
-        return user_orders_list
+        query = filter_orders(select(Order).where(Order.user == user_id), filters)
+        user_orders_list, next_cursor = await paginate_orders(query, filters, session)
+        return {
+            "orders_list": user_orders_list,
+            "next_cursor": next_cursor
+        }
         
-@order_router.get("/order/{order_id}")
+@order_router.get("/order/{order_id}", response_model=ResponseGetOrderSchema)
 async def get_order(
     order_id: int,
-    user: User = Depends(verify_token), 
-    session: Session =  Depends(get_session)
+    user: User = Depends(verify_token_read), 
+    session: AsyncSession = Depends(get_session)
     ):
     """
     Retrieve details of a specific order by its ID.
@@ -138,7 +335,7 @@ async def get_order(
     Args:
         order_id (int): The ID of the order to retrieve.
         user (User): The authenticated user obtained from the JWT token.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
 
     Raises:
         HTTPException: If the order does not exist (status code 400).
@@ -148,9 +345,10 @@ async def get_order(
     Returns:
         dict: A JSON object containing:
             - `qnt_order_itens` (int): The number of items in the order.
-            - `order` (Order): The full order object, including all details.
+            - `order` (ResponseOrderDetailSchema): The full order, including its items.
     """
-    order = session.query(Order).filter(Order.id == order_id).first()
+    result = await session.execute(select(Order).options(WITH_ITENS).where(Order.id == order_id))
+    order = result.scalars().first()
     if not order:
         raise HTTPException(status_code=400, detail="Order not found.")
     if not user.admin and user.id != order.user:
@@ -165,7 +363,7 @@ async def add_iten_order(
     order_id: int,
     order_item_schema: OrderItemSchema,
     user: User = Depends(verify_token), 
-    session: Session =  Depends(get_session)
+    session: AsyncSession = Depends(get_session)
     ):
     """
     Add a new item to an existing order.
@@ -175,14 +373,15 @@ async def add_iten_order(
     Unauthorized users attempting to modify another user's order will receive a 403 Forbidden error.
     If the order does not exist, a 400 Bad Request error is returned.
 
-    After adding the item, the total price of the order is recalculated and stored.
+    The item total (`unit_price * quantity`) is added to the stored order price,
+    without reloading the other items of the order.
 
     Args:
         order_id (int): The ID of the order to which the item will be added.
         order_item_schema (OrderItemSchema): The payload containing item details,
             including quantity, flavor, size, and unit price.
         user (User): The authenticated user obtained from the JWT token.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
 
     Raises:
         HTTPException: If the order does not exist (status code 400).
@@ -195,7 +394,8 @@ async def add_iten_order(
             - `order_item_id` (int): The ID of the newly created order item.
             - `order_price` (float): The updated total price of the order.
     """
-    order = session.query(Order).filter(Order.id == order_id).first()
+    result = await session.execute(select(Order).where(Order.id == order_id).with_for_update())
+    order = result.scalars().first()
     if not order:
         raise HTTPException(status_code=400, detail="Order not found.")
     if not user.admin and user.id != order.user:
@@ -208,19 +408,83 @@ async def add_iten_order(
         order_id
         )
     session.add(order_item)
-    order.calculate_price()
-    session.commit()
+    order.add_item_price(order_item)
+    await session.commit()
     return {
         "response": "Item created successfully",
         "order_item_id": order_item.id,
         "order_price": order.price
     }
 
-@order_router.post("/order/remove_item/{order_item_id}")
+@order_router.post("/order/add_items/{order_id}")
+async def add_itens_order(
+    order_id: int,
+    order_items_schema: OrderItemsBulkSchema,
+    user: User = Depends(verify_token), 
+    session: AsyncSession = Depends(get_session)
+    ):
+    """
+    Add several items to an existing order in a single request.
+
+    This endpoint inserts a list of items (up to 100) into a specific order with
+    one multi-row INSERT, updates the order price once and commits once. The
+    whole list is validated before anything is written, so either every item
+    is added or none is. Access is restricted to the user who owns the order or
+    an admin user. Unauthorized users attempting to modify another user's order
+    will receive a 403 Forbidden error. If the order does not exist, a 400 Bad
+    Request error is returned.
+
+    Args:
+        order_id (int): The ID of the order to which the items will be added.
+        order_items_schema (OrderItemsBulkSchema): The payload containing the
+            `itens` list, each with quantity, flavor, size, and unit price.
+        user (User): The authenticated user obtained from the JWT token.
+        session (AsyncSession): SQLAlchemy async database session dependency.
+
+    Raises:
+        HTTPException: If the order does not exist (status code 400).
+        HTTPException: If the authenticated user is not an admin and
+            attempts to modify another user's order (status code 403).
+
+    Returns:
+        dict: A JSON object containing:
+            - `response` (str): Confirmation message indicating successful creation.
+            - `order_item_ids` (list): The IDs of the new items.
+            - `order_price` (float): The updated total price of the order.
+    """
+    result = await session.execute(select(Order).where(Order.id == order_id).with_for_update())
+    order = result.scalars().first()
+    if not order:
+        raise HTTPException(status_code=400, detail="Order not found.")
+    if not user.admin and user.id != order.user:
+        raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
+    result = await session.execute(
+        insert(OrderItens).values([
+            {
+                "quantity": item.quantity,
+                "flavor": item.flavor,
+                "size": str(item.size),
+                "unit_price": item.unit_price,
+                "order": order_id
+            }
+            for item in order_items_schema.itens
+        ]).returning(OrderItens.id)
+    )
+    order_item_ids = sorted(result.scalars().all())
+    for item in order_items_schema.itens:
+        order.add_item_price(item)
+    await session.commit()
+    return {
+        "response": f"{len(order_item_ids)} items created successfully",
+        "order_item_ids": order_item_ids,
+        "order_price": order.price
+    }
+
+@order_router.post("/order/remove_item/{order_item_id}", response_model=ResponseRemoveItemSchema)
 async def remove_iten_order(
     order_item_id: int,
     user: User = Depends(verify_token), 
-    session: Session =  Depends(get_session)
+    session: AsyncSession = Depends(get_session)
     ):
     """
     Remove an item from an existing order.
@@ -230,12 +494,12 @@ async def remove_iten_order(
     Unauthorized attempts to remove items from another user's order result in a 403 Forbidden error.
     If the item does not exist, a 400 Bad Request error is returned.
 
-    After removing the item, the total price of the order is recalculated and stored.
+    The item total (`unit_price * quantity`) is subtracted from the stored order price.
 
     Args:
         order_item_id (int): The ID of the order item to be removed.
         user (User): The authenticated user obtained from the JWT token.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
 
     Raises:
         HTTPException: If the order item does not exist (status code 400).
@@ -245,18 +509,23 @@ async def remove_iten_order(
     Returns:
         dict: A JSON object containing:
             - `response` (str): Confirmation message indicating successful deletion.
-            - `order_itens` (list): The updated list of remaining items in the order.
-            - `order` (Order): The updated order object, including recalculated price.
+            - `order_itens` (List[ResponseOrderItemSchema]): The updated list of remaining items in the order.
+            - `order` (ResponseOrderDetailSchema): The updated order, including its updated price.
     """
-    order_item = session.query(OrderItens).filter(OrderItens.id == order_item_id).first()
+    # the order is locked before its items are read, so a concurrent removal
+    # of the same item is seen here instead of subtracting its price twice
+    item_order_id = select(OrderItens.order).where(OrderItens.id == order_item_id).scalar_subquery()
+    result = await session.execute(select(Order).options(WITH_ITENS).where(Order.id == item_order_id).with_for_update())
+    order = result.scalars().first()
+    order_item = next((item for item in order.itens if item.id == order_item_id), None) if order else None
     if not order_item:
         raise HTTPException(status_code=400, detail="Item not found.")
-    order = session.query(Order).filter(Order.id == order_item.order).first()
     if not user.admin and user.id != order.user:
         raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
-    session.delete(order_item)
-    order.calculate_price()
-    session.commit()
+    order.itens.remove(order_item)
+    await session.delete(order_item)
+    order.remove_item_price(order_item)
+    await session.commit()
     return {
         "response": "Item deleted successfully",
         "order_itens": order.itens,
@@ -267,7 +536,7 @@ async def remove_iten_order(
 async def cancel_order(
     order_id: int,
     user: User = Depends(verify_token), 
-    session: Session =  Depends(get_session)
+    session: AsyncSession = Depends(get_session)
     ):
     """
     Cancel an existing order.
@@ -282,7 +551,7 @@ async def cancel_order(
     Args:
         order_id (int): The ID of the order to cancel.
         user (User): The authenticated user obtained from the JWT token.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
 
     Raises:
         HTTPException: If the order does not exist (status code 400).
@@ -294,13 +563,14 @@ async def cancel_order(
             - `response` (str): Confirmation message indicating successful cancellation.
             - `order` (Order): The updated order object with the status set to `"canceled"`.
     """
-    order = session.query(Order).filter(Order.id == order_id).first()
+    result = await session.execute(select(Order).where(Order.id == order_id))
+    order = result.scalars().first()
     if not order:
         raise HTTPException(status_code=400, detail="Order not found.")
     if not user.admin and user.id != order.user:
         raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
     order.status = "canceled"
-    session.commit()
+    await session.commit()
     return {
         "response": f"Order {order.id} canceled successfully.",
         "order": order
@@ -310,7 +580,7 @@ async def cancel_order(
 async def complete_order(
     order_id: int,
     user: User = Depends(verify_token), 
-    session: Session =  Depends(get_session)
+    session: AsyncSession = Depends(get_session)
     ):
     """
     Mark an existing order as completed.
@@ -325,7 +595,7 @@ async def complete_order(
     Args:
         order_id (int): The ID of the order to mark as completed.
         user (User): The authenticated user obtained from the JWT token.
-        session (Session): SQLAlchemy database session dependency.
+        session (AsyncSession): SQLAlchemy async database session dependency.
 
     Raises:
         HTTPException: If the order does not exist (status code 400).
@@ -337,13 +607,14 @@ async def complete_order(
             - `response` (str): Confirmation message indicating successful completion.
             - `order` (Order): The updated order object with the status set to `"completed"`.
     """
-    order = session.query(Order).filter(Order.id == order_id).first()
+    result = await session.execute(select(Order).where(Order.id == order_id))
+    order = result.scalars().first()
     if not order:
         raise HTTPException(status_code=400, detail="Order not found.")
     if not user.admin and user.id != order.user:
         raise HTTPException(status_code=403, detail="You are not authorized to make this request.")
     order.status = "completed"
-    session.commit()
+    await session.commit()
     return {
         "response": f"Order {order.id} completed successfully.",
         "order": order
@@ -1,5 +1,10 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from datetime import date
+
+ORDERS_PAGE_SIZE = 50
+ORDERS_MAX_PAGE_SIZE = 200
+ORDER_ITEMS_MAX_BULK = 100
 
 class UserSchema(BaseModel):
     name: str
@@ -33,6 +38,12 @@ class OrderItemSchema(BaseModel):
     class Config:
         from_attributes = True
         
+class OrderItemsBulkSchema(BaseModel):
+    itens: List[OrderItemSchema] = Field(min_length=1, max_length=ORDER_ITEMS_MAX_BULK)
+        
+class OrderWithItemsSchema(OrderSchema):
+    itens: List[OrderItemSchema] = Field(min_length=1, max_length=ORDER_ITEMS_MAX_BULK)
+        
 
 class ResponseOrderSchema(BaseModel):
     id: int
@@ -41,3 +52,51 @@ class ResponseOrderSchema(BaseModel):
     
     class Config:
         from_attributes = True
+        
+class ResponseOrderItemSchema(BaseModel):
+    id: int
+    quantity: int
+    flavor: str
+    size: str
+    unit_price: float
+    
+    class Config:
+        from_attributes = True
+        
+class ResponseOrderDetailSchema(ResponseOrderSchema):
+    user: int
+    itens: List[ResponseOrderItemSchema]
+        
+class ResponseCreateOrderSchema(BaseModel):
+    response: str
+    order: ResponseOrderDetailSchema
+        
+class ResponseGetOrderSchema(BaseModel):
+    qnt_order_itens: int
+    order: ResponseOrderDetailSchema
+        
+class ResponseRemoveItemSchema(BaseModel):
+    response: str
+    order_itens: List[ResponseOrderItemSchema]
+    order: ResponseOrderDetailSchema
+        
+class OrderFilterSchema(BaseModel):
+    cursor: Optional[int] = None
+    limit: int = Field(ORDERS_PAGE_SIZE, ge=1, le=ORDERS_MAX_PAGE_SIZE)
+    status: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+        
+class OrderListFilterSchema(OrderFilterSchema):
+    user_id: Optional[int] = None
+        
+class ResponseOrderPageSchema(BaseModel):
+    orders_list: List[ResponseOrderSchema]
+    next_cursor: Optional[int]
+        
+class OrderExportFilterSchema(BaseModel):
+    format: Literal["ndjson", "csv"] = "ndjson"
+    status: Optional[str] = None
+    # whole days, both ends inclusive
+    created_from: Optional[date] = None
+    created_to: Optional[date] = None
@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import math
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from main import argon2_context
+from metrics import argon2_duration, argon2_queue_wait
+from models import User
+from sqlalchemy import select
+
+ARGON2_WORKERS = int(os.getenv("ARGON2_WORKERS", os.cpu_count() or 1))
+ARGON2_MAX_QUEUE = int(os.getenv("ARGON2_MAX_QUEUE", 32))
+KNOWN_EMAILS_FILTER = os.getenv("KNOWN_EMAILS_FILTER", "true").lower() == "true"
+KNOWN_EMAILS_CAPACITY = int(os.getenv("KNOWN_EMAILS_CAPACITY", 100000))
+KNOWN_EMAILS_REFRESH_INTERVAL = float(os.getenv("KNOWN_EMAILS_REFRESH_INTERVAL", 1))
+
+
+class PasswordHasher:
+    """Runs Argon2 hash/verify on a bounded thread pool instead of the event loop.
+
+    argon2-cffi releases the GIL while hashing, so threads run in parallel.
+    When `workers + max_queue` operations are already pending, new calls are
+    rejected with 503 instead of piling up behind a login storm.
+    """
+
+    def __init__(self, context, workers, max_queue):
+        self.context = context
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.rejected = 0
+        self.dummy_hash = None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="argon2")
+
+    async def hash(self, password):
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password, hashed_password):
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password, hashed_password):
+        """Returns (valid, new_hash); new_hash is set when the stored hash uses outdated parameters."""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    async def verify_dummy(self, password):
+        # same Argon2 cost as a real verify, so unknown emails can't be told
+        # apart from wrong passwords by response time
+        if self.dummy_hash is None:
+            self.dummy_hash = await self.hash(secrets.token_hex(16))
+        await self.verify(password, self.dummy_hash)
+        return False
+
+    def check_capacity(self):
+        """Raises 503 when `workers + max_queue` operations are already pending."""
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Authentication service busy, try again later",
+                headers={"Retry-After": "1"},
+            )
+
+    async def _run(self, func, *args):
+        self.check_capacity()
+        self.pending += 1
+        try:
+            submitted = time.perf_counter()
+            started, result = await asyncio.get_running_loop().run_in_executor(self.executor, self._timed, func, args)
+            finished = time.perf_counter()
+        finally:
+            self.pending -= 1
+        argon2_queue_wait.observe(started - submitted)
+        argon2_duration.observe(finished - started, func.__name__)
+        return result
+
+    @staticmethod
+    def _timed(func, args):
+        return time.perf_counter(), func(*args)
+
+
+password_hasher = PasswordHasher(argon2_context, ARGON2_WORKERS, ARGON2_MAX_QUEUE)
+
+
+class BloomFilter:
+    """Set membership in ~10 bits per item: no false negatives, ~1% false positives."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class KnownEmails:
+    """Bloom filter of registered emails, so unknown emails skip the users query.
+
+    Loaded from the users table on first use, then kept current by pulling
+    only rows with a higher id. A miss triggers that incremental refresh at
+    most once every `refresh_interval` seconds; a miss answered right after
+    such a refresh is definitive. Within the interval the filter may be
+    missing users just created by another worker, so a miss there is reported
+    as "maybe registered" and the caller falls back to the indexed users
+    lookup, never rejecting a new user.
+    """
+
+    def __init__(self, capacity, refresh_interval):
+        self.capacity = capacity
+        self.refresh_interval = refresh_interval
+        self.bloom = None
+        self.max_user_id = 0
+        self.refreshed_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def add(self, email):
+        if self.bloom is not None:
+            self.bloom.add(email)
+
+    async def may_contain(self, email, session):
+        """False only when `email` is certainly not registered."""
+        if self.bloom is not None and email in self.bloom:
+            return True
+        async with self.lock:
+            if self.bloom is not None and time.monotonic() - self.refreshed_at < self.refresh_interval:
+                # refreshed too recently to rule out a signup on another worker
+                return True
+            await self.refresh(session)
+        return email in self.bloom
+
+    async def refresh(self, session):
+        if self.bloom is None or self.bloom.count > self.bloom.capacity:
+            # first load, or grown past the sized capacity: rebuild bigger
+            capacity = max(self.capacity, 2 * (self.bloom.count if self.bloom else 0))
+            self.bloom = BloomFilter(capacity)
+            self.max_user_id = 0
+        result = await session.stream(
+            select(User.id, User.email).where(User.id > self.max_user_id).execution_options(yield_per=10000)
+        )
+        async for partition in result.partitions():
+            for user_id, email in partition:
+                self.bloom.add(email)
+                self.max_user_id = max(self.max_user_id, user_id)
+        self.refreshed_at = time.monotonic()
+
+
+known_emails = KnownEmails(KNOWN_EMAILS_CAPACITY, KNOWN_EMAILS_REFRESH_INTERVAL)
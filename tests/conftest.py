@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+
+# the app reads its settings at import time, so they are fixed here, before
+# any app module is imported; USER_CACHE_TTL=0 makes every request resolve
+# its user from the database, which is what the query count tests measure
+DATABASE_DIR = tempfile.mkdtemp()
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{DATABASE_DIR}/test.db",
+    SECRET_KEY="test-secret-key",
+    ALGORITHM="HS256",
+    ACCESS_TOKEN_EXPIRE_MINUTES="30",
+    USER_CACHE_TTL="0",
+    TOKEN_CACHE_TTL="0",
+)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+
+from main import app
+from models import Base, db
+
+
+@pytest.fixture(scope="session")
+def client():
+    engine = create_engine(os.environ["DATABASE_URL"])
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    user = {"name": "admin", "email": "admin@test.com", "password": "admin", "activated": True, "admin": True}
+    client.post("/auth/signup_admin", json=user).raise_for_status()
+    response = client.post("/auth/login", json={"email": user["email"], "password": user["password"]})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def statements():
+    """SQL statements executed by the app while the test runs, in order."""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(db.sync_engine, "before_cursor_execute", record)
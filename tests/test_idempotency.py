@@ -0,0 +1,41 @@
+import time
+
+from idempotency import DatabaseIdempotencyStore
+from models import IdempotencyKey, SessionLocal
+
+
+def test_retry_after_token_refresh_is_replayed(client, admin_headers):
+    response = client.post("/auth/login", json={"email": "admin@test.com", "password": "admin"})
+    tokens = response.json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}", "Idempotency-Key": "refresh-retry"}
+    first = client.post("/orders/order", json={"user_id": 1}, headers=headers)
+
+    # tokens only differ by their "exp" second
+    time.sleep(1)
+    response = client.post("/auth/refresh", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.json()["access_token"] != tokens["access_token"]
+    headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+    retry = client.post("/orders/order", json={"user_id": 1}, headers=headers)
+
+    assert retry.status_code == 200
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert retry.json() == first.json()
+
+
+def test_database_store_prunes_expired_keys(client):
+    store = DatabaseIdempotencyStore(ttl=60, pending_timeout=10, prune_interval=0)
+
+    async def add_expired_key():
+        async with SessionLocal() as session:
+            session.add(IdempotencyKey("expired", "hash", time.time() - 120))
+            await session.commit()
+
+    async def get_key(key):
+        async with SessionLocal() as session:
+            return await session.get(IdempotencyKey, key)
+
+    client.portal.call(add_expired_key)
+    assert client.portal.call(store.claim, "fresh", "hash") is None
+
+    assert client.portal.call(get_key, "expired") is None
+    assert client.portal.call(get_key, "fresh") is not None
@@ -0,0 +1,23 @@
+from main import argon2_context
+from models import SessionLocal, User
+from security import known_emails
+
+
+def test_user_created_by_another_worker_can_log_in_right_away(client, admin_headers):
+    async def refresh_filter():
+        async with SessionLocal() as session:
+            # a miss refreshes the filter, starting a KNOWN_EMAILS_REFRESH_INTERVAL window
+            return await known_emails.may_contain("nobody@test.com", session)
+
+    async def signup_elsewhere():
+        # written straight to the table, the way another worker's signup looks to this one
+        async with SessionLocal() as session:
+            session.add(User("elsewhere", "elsewhere@test.com", argon2_context.hash("elsewhere")))
+            await session.commit()
+
+    assert client.portal.call(refresh_filter) is False
+    client.portal.call(signup_elsewhere)
+
+    response = client.post("/auth/login", json={"email": "elsewhere@test.com", "password": "elsewhere"})
+
+    assert response.status_code == 200
@@ -0,0 +1,60 @@
+import pytest
+
+import instrumentation
+
+ITEM = {"quantity": 2, "flavor": "calabresa", "size": 35, "unit_price": 39.9}
+ITENS_PER_ORDER = 5
+
+
+@pytest.fixture
+def query_budget(monkeypatch):
+    """Fails the request with QueryBudgetExceeded above `budget` statements or on any repeated statement."""
+    monkeypatch.setattr(instrumentation, "QUERY_BUDGET_MODE", "raise")
+    monkeypatch.setattr(instrumentation, "QUERY_REPEAT_LIMIT", 2)
+
+    def set_budget(budget):
+        monkeypatch.setattr(instrumentation, "QUERY_BUDGET", budget)
+    return set_budget
+
+
+@pytest.fixture
+def order(client, admin_headers):
+    response = client.post(
+        "/orders/order/with_items",
+        json={"user_id": 1, "itens": [ITEM] * ITENS_PER_ORDER},
+        headers=admin_headers,
+    )
+    assert response.status_code == 200
+    return response.json()["order"]
+
+
+# statement budgets hold for any number of items per order, so a lazy load
+# of order.itens (one query per order or per item) breaks them
+@pytest.mark.parametrize("method, path, body, budget", [
+    ("GET", "/orders/order/{order_id}", None, 3),
+    ("GET", "/orders/list", None, 2),
+    ("GET", "/orders/list/orders_user/1", None, 2),
+    ("POST", "/orders/order/add_item/{order_id}", ITEM, 4),
+    ("POST", "/orders/order/add_items/{order_id}", {"itens": [ITEM] * ITENS_PER_ORDER}, 4),
+    ("POST", "/orders/order/remove_item/{item_id}", None, 5),
+    ("POST", "/orders/order/with_items", {"user_id": 1, "itens": [ITEM] * ITENS_PER_ORDER}, 3),
+])
+def test_order_routes_stay_within_query_budget(client, admin_headers, order, query_budget, method, path, body, budget):
+    query_budget(budget)
+    path = path.format(order_id=order["id"], item_id=order["itens"][0]["id"])
+
+    response = client.request(method, path, json=body, headers=admin_headers)
+
+    assert response.status_code == 200
+
+
+def test_removing_an_item_twice_subtracts_its_price_once(client, admin_headers, order):
+    path = f"/orders/order/remove_item/{order['itens'][0]['id']}"
+
+    first = client.post(path, headers=admin_headers)
+    second = client.post(path, headers=admin_headers)
+
+    assert first.status_code == 200
+    assert first.json()["order"]["price"] == pytest.approx(order["price"] - ITEM["quantity"] * ITEM["unit_price"])
+    assert second.status_code == 400
+    assert second.json()["detail"] == "Item not found."
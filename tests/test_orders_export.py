@@ -0,0 +1,20 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+
+def export_ids(client, headers, **params):
+    response = client.get("/orders/export", params=params, headers=headers)
+    assert response.status_code == 200
+    return [json.loads(line)["id"] for line in response.text.splitlines()]
+
+
+def test_export_date_range_includes_both_days(client, admin_headers):
+    response = client.post("/orders/order", json={"user_id": 1}, headers=admin_headers)
+    order_id = int(response.json()["response"].rsplit(" ", 1)[1])
+    today = datetime.now(timezone.utc).date()
+    yesterday = today - timedelta(days=1)
+
+    assert order_id in export_ids(client, admin_headers, created_from=today, created_to=today)
+    assert order_id in export_ids(client, admin_headers, created_to=today)
+    assert order_id not in export_ids(client, admin_headers, created_to=yesterday)
+    assert order_id not in export_ids(client, admin_headers, created_from=today + timedelta(days=1))
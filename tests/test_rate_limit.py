@@ -0,0 +1,27 @@
+import time
+
+from models import RateLimitBucket, SessionLocal
+from rate_limit import DatabaseRateLimitBackend
+
+
+def test_database_backend_prunes_refilled_buckets(client):
+    backend = DatabaseRateLimitBackend(prune_interval=0)
+
+    async def add_bucket(key, updated_at):
+        async with SessionLocal() as session:
+            session.add(RateLimitBucket(key, 0, updated_at))
+            await session.commit()
+
+    async def get_bucket(key):
+        async with SessionLocal() as session:
+            return await session.get(RateLimitBucket, key)
+
+    # 5 tokens at 1 per second: full again after 5 seconds
+    client.portal.call(add_bucket, "login:email:refilled", time.time() - 10)
+    client.portal.call(add_bucket, "login:email:refilling", time.time() - 1)
+
+    allowed, _ = client.portal.call(backend.consume, "login:email:new", 5, 1)
+
+    assert allowed
+    assert client.portal.call(get_bucket, "login:email:refilled") is None
+    assert client.portal.call(get_bucket, "login:email:refilling") is not None
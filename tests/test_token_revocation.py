@@ -0,0 +1,28 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from dependencies import load_revoked_token_versions, revoked_token_versions, verify_token_claims
+
+
+def test_revocations_are_reloaded_from_the_database(client, admin_headers):
+    user = {"name": "revoked", "email": "revoked@test.com", "password": "revoked", "activated": True, "admin": False}
+    client.post("/auth/signup", json=user, headers=admin_headers).raise_for_status()
+    response = client.post("/auth/login", json={"email": user["email"], "password": user["password"]})
+    token = response.json()["access_token"]
+
+    def verify():
+        return client.portal.call(verify_token_claims, SimpleNamespace(state=SimpleNamespace()), token)
+
+    user_id = verify().id
+    client.post(f"/admin/revoke_tokens/{user_id}", headers=admin_headers).raise_for_status()
+    # a restarted worker, or one that didn't serve the revocation
+    revoked_token_versions.clear()
+
+    client.portal.call(load_revoked_token_versions)
+
+    assert revoked_token_versions[user_id] == 1
+    with pytest.raises(HTTPException) as error:
+        verify()
+    assert error.value.status_code == 401
@@ -0,0 +1,29 @@
+import pytest
+
+
+def users_selects(statements):
+    return [
+        statement for statement in statements
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement
+    ]
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("GET", "/orders/", None),
+    ("GET", "/orders/list", None),
+    ("GET", "/orders/list/orders_user/1", None),
+    ("GET", "/orders/order/{order_id}", None),
+    ("POST", "/orders/order", {"user_id": 1}),
+    ("POST", "/orders/order/add_item/{order_id}", {"quantity": 1, "flavor": "calabresa", "size": 35, "unit_price": 39.9}),
+])
+def test_one_user_lookup_per_order_request(client, admin_headers, statements, method, path, body):
+    # the router dependency and the endpoint dependency both ask for
+    # verify_token; the user must still be loaded only once
+    response = client.post("/orders/order", json={"user_id": 1}, headers=admin_headers)
+    order_id = int(response.json()["response"].rsplit(" ", 1)[1])
+    statements.clear()
+
+    response = client.request(method, path.format(order_id=order_id), json=body, headers=admin_headers)
+
+    assert response.status_code == 200
+    assert len(users_selects(statements)) == 1